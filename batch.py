@@ -0,0 +1,196 @@
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import contextlib
+import io
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import csp
+from solver import Solver, SOLVED, load_map, get_graph, parse_options
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+OUTPUT_DIRECTORY = 'colored'
+MANIFEST_NAME = 'manifest.csv'
+MANIFEST_FIELDS = ['map', 'output', 'status', 'regions', 'edges', 'preprocessing_time', 'solve_time', 'message']
+ERROR = 'error'
+PENDING_MAPS_PER_WORKER = 2
+OPTIONS = ['output-dir', 'manifest', 'workers', 'no-cache', 'time-limit', 'peel', 'dsatur']
+
+
+def get_image_paths(pattern):
+    """
+        returns the sorted image files of the directory pattern, or the files matching the glob pattern
+    """
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern)
+    return sorted(path for path in paths if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def get_input_root(image_paths):
+    """
+        returns the deepest directory that holds all the image_paths
+    """
+    return os.path.commonpath([os.path.dirname(os.path.abspath(image_path)) for image_path in image_paths])
+
+
+def get_output_path(image_path, input_root, output_directory):
+    """
+        returns the path of the colored map in output_directory, under the same subdirectories as the image under
+        input_root, and named after the image with its extension, so that a.png and a.jpg, or two a.png in different
+        directories, do not write the same output
+    """
+    relative_path = os.path.relpath(os.path.abspath(image_path), input_root)
+    stem, extension = os.path.splitext(relative_path)
+    return os.path.join(output_directory, f"{stem}_{extension.lstrip('.')}_colored.png")
+
+
+def is_csv_manifest(manifest_path):
+    return manifest_path.lower().endswith('.csv')
+
+
+def read_manifest(manifest_path):
+    """
+        returns the rows of the manifest by map, the last row of a map winning, or nothing if there is no manifest
+        a CSV manifest has a header line, any other manifest holds one JSON object per line
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, newline='') as manifest_file:
+        if is_csv_manifest(manifest_path):
+            rows = list(csv.DictReader(manifest_file))
+        else:
+            rows = [json.loads(line) for line in manifest_file if line.strip()]
+    return {row['map']: row for row in rows}
+
+
+def append_manifest_row(manifest_path, row):
+    """
+        appends the row of one map to the manifest and flushes it, so that an interrupted run loses no finished map
+    """
+    is_new_manifest = not os.path.exists(manifest_path) or os.path.getsize(manifest_path) == 0
+    with open(manifest_path, 'a', newline='') as manifest_file:
+        if is_csv_manifest(manifest_path):
+            writer = csv.DictWriter(manifest_file, MANIFEST_FIELDS)
+            if is_new_manifest:
+                writer.writeheader()
+            writer.writerow(row)
+        else:
+            manifest_file.write(json.dumps(row) + '\n')
+
+
+def is_done(row):
+    """
+        a map is done when it has a row in the manifest that is not an error, and its colored output still exists
+        if it was solved, so that the maps that failed are tried again
+    """
+    return row is not None and row['status'] != ERROR and (row['status'] != SOLVED or os.path.exists(row['output']))
+
+
+def get_error_row(image_path, output_path, message):
+    return {'map': image_path, 'output': output_path, 'status': ERROR, 'regions': 0, 'edges': 0,
+            'preprocessing_time': 0.0, 'solve_time': 0.0, 'message': message}
+
+
+def process_map(image_path, output_path, config, use_cache=True):
+    """
+        runs in a worker process: decodes and preprocesses the image, colors it with a Solver of config and writes
+        the colored map to output_path if it was solved
+        returns the manifest row of the map, an ERROR row with the message of the error if the image cannot be read
+        or anything raised, so that one bad map does not stop the batch
+    """
+    row = get_error_row(image_path, output_path, '')
+    try:
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            image_map = load_map(image_path, use_cache=use_cache)
+        row['preprocessing_time'] = time.perf_counter() - start_time
+        if image_map is None:
+            row['message'] = 'cannot read the image'
+            return row
+        solver = Solver(get_graph(image_map), image_map=image_map, **config)
+        start_time = time.perf_counter()
+        result = solver.solve()
+        row.update(status=result.status, regions=len(solver.graph), solve_time=time.perf_counter() - start_time,
+                   edges=sum(len(neighbors) for neighbors in solver.graph.values()) // 2)
+        if result.solved:
+            solver.show_solution(output_path)
+    except Exception as error:
+        row.update(status=ERROR, message=f'{type(error).__name__}: {error}')
+    return row
+
+
+def run_batch(image_paths, output_directory=OUTPUT_DIRECTORY, manifest_path=None, config=None, max_workers=None,
+              use_cache=True):
+    """
+        colors the maps of image_paths in a process pool of max_workers workers (one per CPU by default), each worker
+        decoding, preprocessing and solving its own maps, so that the decoding of some maps overlaps the solving
+        of others, and at most PENDING_MAPS_PER_WORKER maps per worker are submitted at a time
+        the colored maps are written to output_directory, and the row of each map is appended to the manifest
+        (MANIFEST_NAME in output_directory by default) as soon as it finishes
+        the maps that are already done in the manifest are skipped, so that an interrupted run can be resumed
+        a map whose worker died gets an ERROR row too, and the batch goes on with the others
+        returns the rows of the maps processed by this run, in the order they finished
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(output_directory, MANIFEST_NAME)
+    done_rows = read_manifest(manifest_path)
+    pending_paths = [image_path for image_path in image_paths if not is_done(done_rows.get(image_path))]
+    pending_paths.reverse()
+    input_root = get_input_root(image_paths) if image_paths else ''
+    max_workers = max_workers or os.cpu_count()
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        while pending_paths or futures:
+            while pending_paths and len(futures) < max_workers * PENDING_MAPS_PER_WORKER:
+                image_path = pending_paths.pop()
+                output_path = get_output_path(image_path, input_root, output_directory)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                future = executor.submit(process_map, image_path, output_path, config or {}, use_cache)
+                futures[future] = image_path, output_path
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    row = future.result()
+                except Exception as error:
+                    row = get_error_row(*futures[future], f'{type(error).__name__}: {error}')
+                del futures[future]
+                append_manifest_row(manifest_path, row)
+                rows.append(row)
+                print(f"{row['map']:<40}{row['status']:<12}{row['regions']:>8}{row['edges']:>8}"
+                      f"{row['preprocessing_time']:>10.3f}{row['solve_time']:>10.3f}"
+                      + (f"  {row['message']}" if row['message'] else ""))
+    return rows
+
+
+if __name__ == "__main__":
+    arguments, options = parse_options(sys.argv[1:])
+    unknown_options = [name for name in options if name not in OPTIONS]
+    if len(arguments) != 1 or unknown_options:
+        print("usage: python batch.py <directory|glob> [--output-dir=<directory>] [--manifest=<path>] "
+              "[--workers=<n>] [--no-cache] [--time-limit=<seconds>] [--peel] [--dsatur]")
+        exit(1)
+    try:
+        max_workers = int(options['workers']) if options.get('workers') else None
+        time_limit = float(options['time-limit']) if options.get('time-limit') else None
+    except ValueError:
+        print("Error: invalid arguments.")
+        exit(1)
+    image_paths = get_image_paths(arguments[0])
+    if not image_paths:
+        print(f"no images found in {arguments[0]}")
+        exit(1)
+    config = {'time_limit': time_limit, 'use_peeling': 'peel' in options,
+              'variable_heuristic': csp.DSATUR if 'dsatur' in options else csp.MRV}
+    start_time = time.perf_counter()
+    rows = run_batch(image_paths, options.get('output-dir') or OUTPUT_DIRECTORY, options.get('manifest') or None,
+                     config, max_workers, use_cache='no-cache' not in options)
+    n_solved = sum(row['status'] == SOLVED for row in rows)
+    print(f"{len(rows)} maps processed, {n_solved} solved, {len(image_paths) - len(rows)} already done, "
+          f"{time.perf_counter() - start_time:.3f}s")
+    if n_solved < len(rows):
+        exit(1)
@@ -0,0 +1,798 @@
+import os
+import sys
+import json
+import time
+import contextlib
+import io
+import itertools
+import random
+import shutil
+import tempfile
+import tracemalloc
+import cv2
+import numpy as np
+from map import Map, MAXIMUM_IMAGE_WIDTH, MAXIMUM_IMAGE_HEIGHT
+from synthetic import get_delaunay_graph, get_sparse_planar_graph, render_voronoi_map
+from solver import Solver, COLORING_COLORS, NONE_COLOR, parse_options
+from render import RegionPainter
+import csp
+import local_search
+import decomposition
+import incremental
+import minimize
+import batch
+import utils
+
+BENCHMARK_MAPS = ['iran.jpg', 'usa.png', 'tehran_province.jpg']
+LABELLING_SCALES = [0.25, 0.5, 0.75, 1.0]
+SYNTHETIC_GRAPH_SIZES = [1000, 5000]
+SEARCH_NODE_LIMIT = 5000
+N_COLORS = 4
+SEARCH_MODES = [('-n', csp.AC3, csp.MRV), ('-n', csp.AC3, csp.DSATUR), ('-fc', csp.AC3, csp.MRV),
+                ('-fc', csp.AC3, csp.DSATUR), ('-ac', csp.AC3, csp.MRV), ('-ac', csp.AC2001, csp.MRV)]
+LOCAL_SEARCH_GRAPH_SIZES = [1000, 5000, 20000]
+LOCAL_SEARCH_MAX_STEPS = 1000000
+LOCAL_SEARCH_VARIANTS = [(0, False), (local_search.TABU_TENURE, False), (0, True), (local_search.TABU_TENURE, True)]
+SUITE_GRAPH_SIZES = [10, 100, 1000, 10000, 100000]
+SUITE_RENDERED_SIZES = [10, 100]
+SUITE_NODE_LIMIT = 1000
+SUITE_MAX_STEPS = 100000
+SUITE_CONFIGS = [(filtering_mode, use_variable_ordering, use_value_ordering)
+                 for filtering_mode in ['-n', '-fc', '-ac']
+                 for use_variable_ordering in [False, True]
+                 for use_value_ordering in [False, True]] + [('-ii', None, None)]
+PEELING_GRAPH_SIZES = [1000, 10000]
+PEELING_KEPT_EDGE_RATIOS = [1.0, 0.65]
+ARRAY_GRAPH_SIZES = [1000, 10000, 100000]
+ARRAY_CHECK_REPEATS = 20
+ARRAY_CHECK_N_COLORS = [N_COLORS, 12, 40, 64]
+ARRAY_CHECK_GRAPH_SIZE = 300
+INCREMENTAL_RENDERED_SIZES = [100]
+INCREMENTAL_GRAPH_SIZES = [10000, 100000]
+INCREMENTAL_EDIT_SIZE = 40
+INCREMENTAL_N_EDITS = 3
+RENDERING_RENDERED_SIZES = [100, 1000]
+RENDERING_N_FRAMES = 10
+ANYTIME_GRAPH_SIZES = [1000, 10000]
+ANYTIME_TIME_LIMITS = [0.1, 1.0]
+ANYTIME_MODES = ['-fc', '-ii']
+BATCH_WORKERS = 2
+BAD_MAP_NAME = 'corrupt.png'
+COPIES_DIRECTORY = 'copies'
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+LOCAL_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.local.json')
+BASELINE_FIELDS = ['result', 'nodes', 'colors']
+TIME_REGRESSION_THRESHOLD = 1.0
+MEMORY_REGRESSION_THRESHOLD = 0.25
+MINIMUM_TIME_REGRESSION = 0.05
+MINIMUM_MEMORY_REGRESSION = 2 ** 20
+
+
+def run_preprocessing(image_path, **map_options):
+    """
+        runs Map.initial_preprocessing() on the image and returns the map with the elapsed seconds
+    """
+    return preprocess_image(cv2.imread(image_path, cv2.IMREAD_COLOR), **map_options)
+
+
+def preprocess_image(image, **map_options):
+    image_map = Map(image, **map_options)
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        image_map.initial_preprocessing()
+    return image_map, time.perf_counter() - start_time
+
+
+def graph_signature(image_map):
+    nodes = [(node.id, int(node.x), int(node.y)) for node in image_map.nodes]
+    edges = {(node.id, adj) for node in image_map.nodes for adj in node.adj if node.id < adj}
+    return nodes, edges
+
+
+def benchmark_preprocessing(image_paths):
+    """
+        compares the pixel-loop and the vectorized preprocessing paths on each map
+        returns False if the two paths extracted different graphs, or if the vectorized path was slower
+    """
+    all_passed = True
+    print(f"{'map':<24}{'regions':>8}{'edges':>8}{'loops (s)':>12}{'vectorized (s)':>16}{'speedup':>9}")
+    for image_path in image_paths:
+        loop_map, loop_time = run_preprocessing(image_path)
+        vectorized_map, vectorized_time = run_preprocessing(image_path, vectorized=True)
+        nodes, edges = graph_signature(loop_map)
+        same_graph = (nodes, edges) == graph_signature(vectorized_map)
+        is_slower = vectorized_time > loop_time
+        all_passed = all_passed and same_graph and not is_slower
+        print(f"{image_path:<24}{len(nodes):>8}{len(edges):>8}{loop_time:>12.2f}{vectorized_time:>16.2f}"
+              f"{loop_time / vectorized_time:>8.1f}x" + ("" if same_graph else "  GRAPH MISMATCH")
+              + ("  SLOWER" if is_slower else ""))
+    return all_passed
+
+
+def time_labelling(image, use_connected_components):
+    """
+        returns the seconds find_graph_nodes() takes on the filtered image, with the regions it found
+    """
+    image_map = Map(image, vectorized=True, use_connected_components=use_connected_components)
+    image_map.filter_image()
+    start_time = time.perf_counter()
+    image_map.find_graph_nodes()
+    return time.perf_counter() - start_time, len(image_map.nodes)
+
+
+def benchmark_labelling(image_paths):
+    """
+        times the flood fill and the connected-components labelling on each map at growing sizes,
+        the time per megapixel of the connected-components column should stay flat
+        returns False if the two labelling engines found a different number of regions
+    """
+    all_equal = True
+    print(f"{'map':<24}{'pixels':>10}{'regions':>8}{'flood fill (s)':>16}{'components (s)':>16}{'s/Mpx':>8}")
+    for image_path in image_paths:
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        for scale in LABELLING_SCALES:
+            scaled_image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+            n_pixels = scaled_image.shape[0] * scaled_image.shape[1]
+            flood_fill_time, flood_fill_regions = time_labelling(scaled_image.copy(), False)
+            components_time, components_regions = time_labelling(scaled_image.copy(), True)
+            all_equal = all_equal and flood_fill_regions == components_regions
+            print(f"{image_path:<24}{n_pixels:>10}{components_regions:>8}{flood_fill_time:>16.3f}"
+                  f"{components_time:>16.3f}{components_time / n_pixels * 10 ** 6:>8.3f}"
+                  + ("" if flood_fill_regions == components_regions else "  REGION MISMATCH"))
+    return all_equal
+
+
+def time_adjacency(image, use_spatial_index):
+    """
+        returns the seconds the adjacency builder takes on the labelled image, with the edges it found
+    """
+    image_map = Map(image, vectorized=True, use_connected_components=True, use_spatial_index=use_spatial_index)
+    image_map.filter_image()
+    image_map.find_graph_nodes()
+    start_time = time.perf_counter()
+    if use_spatial_index:
+        image_map.add_graph_edges_spatial()
+    else:
+        image_map.add_graph_edges()
+    return time.perf_counter() - start_time, graph_signature(image_map)[1]
+
+
+def benchmark_adjacency(image_paths):
+    """
+        compares the pairwise are_adjacent() scan with the KD-tree adjacency builder on each map
+        returns False if the two builders found different edge sets
+    """
+    all_equal = True
+    print(f"{'map':<24}{'edges':>8}{'pairwise (s)':>14}{'kd-tree (s)':>13}{'speedup':>9}")
+    for image_path in image_paths:
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        pairwise_time, pairwise_edges = time_adjacency(image.copy(), False)
+        spatial_time, spatial_edges = time_adjacency(image.copy(), True)
+        all_equal = all_equal and pairwise_edges == spatial_edges
+        print(f"{image_path:<24}{len(pairwise_edges):>8}{pairwise_time:>14.2f}{spatial_time:>13.2f}"
+              f"{pairwise_time / spatial_time:>8.1f}x" + ("" if pairwise_edges == spatial_edges else "  EDGE MISMATCH"))
+    return all_equal
+
+
+def get_map_graph(image_path):
+    image_map, _ = run_preprocessing(image_path, vectorized=True, use_connected_components=True,
+                                     use_spatial_index=True)
+    return {node.id: set(node.adj) for node in image_map.nodes}
+
+
+def benchmark_search(image_paths):
+    """
+        measures the search nodes per second of every backtracking mode on the maps and on synthetic planar graphs,
+        each search stops after SEARCH_NODE_LIMIT nodes, -ac runs with both arc revision algorithms,
+        and -n and -fc with both variable heuristics when the variable ordering is on
+        returns False if a search returned an invalid coloring
+    """
+    graphs = [(image_path, get_map_graph(image_path)) for image_path in image_paths]
+    graphs += [(f'delaunay-{n_regions}', get_delaunay_graph(n_regions)) for n_regions in SYNTHETIC_GRAPH_SIZES]
+    all_valid = True
+    print(f"{'graph':<24}{'mode':>5}{'ac':>8}{'heuristic':>10}{'var':>5}{'val':>5}{'result':>8}{'nodes':>8}{'revisions':>11}"
+          f"{'time (s)':>10}{'nodes/s':>10}")
+    for name, graph in graphs:
+        for (filtering_mode, ac_algorithm, variable_heuristic), use_variable_ordering, use_value_ordering in \
+                itertools.product(SEARCH_MODES, [False, True], [False, True]):
+            if variable_heuristic != csp.MRV and not use_variable_ordering:
+                continue
+            domains = [list(range(N_COLORS)) for _ in range(len(graph))]
+            search = csp.ColoringCSP(graph, N_COLORS, domains, filtering_mode, use_variable_ordering,
+                                     use_value_ordering, node_limit=SEARCH_NODE_LIMIT, ac_algorithm=ac_algorithm,
+                                     variable_heuristic=variable_heuristic)
+            start_time = time.perf_counter()
+            solved = search.solve()
+            elapsed_time = time.perf_counter() - start_time
+            valid = not solved or all(search.assignment[u] != search.assignment[v] for u in graph for v in graph[u])
+            all_valid = all_valid and valid
+            result = {True: 'solved', False: 'failed', None: 'limit'}[solved] if valid else 'INVALID'
+            print(f"{name:<24}{filtering_mode:>5}{ac_algorithm if filtering_mode == '-ac' else '':>8}"
+                  f"{variable_heuristic if use_variable_ordering else '':>10}"
+                  f"{str(use_variable_ordering)[0]:>5}{str(use_value_ordering)[0]:>5}"
+                  f"{result:>8}{search.expanded_nodes:>8}{search.revisions:>11}{elapsed_time:>10.3f}"
+                  f"{search.expanded_nodes / elapsed_time:>10.0f}")
+    return all_valid
+
+
+def benchmark_local_search(image_paths):
+    """
+        measures the steps per second and the time to solution of the min-conflicts search, with and without tabu
+        and breakout, on the maps and on synthetic planar graphs, each search stops after LOCAL_SEARCH_MAX_STEPS steps
+        returns False if a search returned an invalid coloring
+    """
+    graphs = [(image_path, get_map_graph(image_path)) for image_path in image_paths]
+    graphs += [(f'delaunay-{n_regions}', get_delaunay_graph(n_regions)) for n_regions in LOCAL_SEARCH_GRAPH_SIZES]
+    all_valid = True
+    print(f"{'graph':<24}{'tabu':>5}{'breakout':>9}{'result':>8}{'steps':>9}{'restarts':>9}{'time (s)':>10}"
+          f"{'steps/s':>10}")
+    for name, graph in graphs:
+        for tabu_tenure, use_breakout in LOCAL_SEARCH_VARIANTS:
+            domains = [list(range(N_COLORS)) for _ in range(len(graph))]
+            search = local_search.MinConflicts(graph, domains, random.Random(0), tabu_tenure, use_breakout)
+            start_time = time.perf_counter()
+            solved = search.solve(LOCAL_SEARCH_MAX_STEPS)
+            elapsed_time = time.perf_counter() - start_time
+            valid = not solved or all(search.assignment[u] != search.assignment[v] for u in graph for v in graph[u])
+            all_valid = all_valid and valid
+            result = ('solved' if solved else 'limit') if valid else 'INVALID'
+            print(f"{name:<24}{tabu_tenure:>5}{str(use_breakout)[0]:>9}{result:>8}{search.steps:>9}"
+                  f"{search.restarts:>9}{elapsed_time:>10.3f}{search.steps / elapsed_time:>10.0f}")
+    return all_valid
+
+
+def run_peeled_search(graph, use_peeling):
+    """
+        runs -fc -t -t within SEARCH_NODE_LIMIT nodes, on the core left by decomposition.peel_low_degree() when
+        use_peeling is True, and colors the peeled variables back
+        returns the result ('solved', 'failed', 'limit' or 'INVALID'), the size of the searched graph and the nodes
+    """
+    core, peeled = decomposition.peel_low_degree(graph, N_COLORS) if use_peeling else (list(graph), [])
+    subgraph = decomposition.get_subgraph(graph, core)
+    search = csp.ColoringCSP(subgraph, N_COLORS, [list(range(N_COLORS)) for _ in core], '-fc', True, True,
+                             node_limit=SEARCH_NODE_LIMIT)
+    solved = search.solve()
+    if not solved:
+        return {False: 'failed', None: 'limit'}[solved], len(core), search.expanded_nodes
+    assignment = {variable: None for variable in graph}
+    assignment.update((variable, search.assignment[i]) for i, variable in enumerate(core))
+    decomposition.color_peeled(graph, assignment, peeled, N_COLORS)
+    valid = all(assignment[u] != assignment[v] for u in graph for v in graph[u])
+    return 'solved' if valid else 'INVALID', len(core), search.expanded_nodes
+
+
+def benchmark_peeling(image_paths):
+    """
+        compares the -fc -t -t search on the whole graph and on the core left after peeling the variables with
+        fewer than N_COLORS neighbors, on the maps, on random planar triangulations and on sparser planar graphs
+        returns False if a peeled search returned an invalid coloring
+    """
+    graphs = [(image_path, get_map_graph(image_path)) for image_path in image_paths]
+    graphs += [(f'planar-{n_regions}-{kept_edge_ratio}', get_sparse_planar_graph(n_regions, kept_edge_ratio))
+               for n_regions in PEELING_GRAPH_SIZES for kept_edge_ratio in PEELING_KEPT_EDGE_RATIOS]
+    all_valid = True
+    print(f"{'graph':<24}{'regions':>8}{'core':>8}{'result':>8}{'nodes':>8}{'time (s)':>10}"
+          f"{'peeled result':>15}{'nodes':>8}{'time (s)':>10}")
+    for name, graph in graphs:
+        start_time = time.perf_counter()
+        result, _, nodes = run_peeled_search(graph, False)
+        elapsed_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        peeled_result, core_size, peeled_nodes = run_peeled_search(graph, True)
+        peeled_time = time.perf_counter() - start_time
+        all_valid = all_valid and 'INVALID' not in (result, peeled_result)
+        print(f"{name:<24}{len(graph):>8}{core_size:>8}{result:>8}{nodes:>8}{elapsed_time:>10.3f}"
+              f"{peeled_result:>15}{peeled_nodes:>8}{peeled_time:>10.3f}")
+    return all_valid
+
+
+def get_peak_memory(function):
+    """
+        returns the result of function and the peak memory in bytes it allocated
+    """
+    tracemalloc.start()
+    result = function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak_memory
+
+
+def time_check(function, repeats=ARRAY_CHECK_REPEATS):
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start_time) / repeats
+
+
+def check_array_versions(graph, n_colors, seed=0):
+    """
+        runs forward_check and get_chosen_value on every variable of the graph with a random partial assignment and
+        random domains of n_colors colors, small enough to be wiped out, with the dict and the array versions
+        returns False if they disagree on a wipe-out, on the pruned domains, or on the conflicts of the chosen value
+    """
+    rng = random.Random(seed)
+    sorted_graph = {variable: sorted(neighbors) for variable, neighbors in graph.items()}
+    indptr, indices = utils.to_csr(graph)
+    pairs = {variable: rng.randrange(n_colors) if rng.random() < 0.5 else None for variable in graph}
+    domains = [rng.sample(range(n_colors), rng.randint(1, 2)) for _ in graph]
+    assignment = utils.to_assignment_array(pairs, n_colors)
+    for variable in graph:
+        value = rng.randrange(n_colors)
+        domain_array = utils.to_domain_array(domains, n_colors)
+        pruned_domains = [list(domain) for domain in domains]
+        needs_backtracking = utils.forward_check(sorted_graph, pairs, pruned_domains, variable, value)
+        if utils.forward_check_array(indptr, indices, assignment, domain_array, variable, value) != \
+                needs_backtracking or \
+                not np.array_equal(domain_array, utils.to_domain_array(pruned_domains, n_colors)):
+            return False
+        conflicts = {color: sum(pairs[neighbor] == color for neighbor in graph[variable])
+                     for color in domains[variable]}
+        chosen_value = utils.get_chosen_value_array(indptr, indices, assignment,
+                                                    utils.to_domain_array(domains, n_colors), variable, rng)
+        if conflicts[chosen_value] != min(conflicts.values()):
+            return False
+    return True
+
+
+def benchmark_arrays(image_paths):
+    """
+        compares the memory and the latency of is_consistent, is_solved, forward_check and get_chosen_value
+        on the dict of sets graph, dict assignment and list domains against their versions on the CSR graph,
+        int8 assignment array and bitmask domain array, on random planar triangulations
+        the whole-graph checks run on a complete coloring, and the checks of one variable run after its neighbors
+        were unassigned, then check_array_versions() compares the checks of one variable with ARRAY_CHECK_N_COLORS
+        returns False if the two versions disagree
+    """
+    all_equal = True
+    print(f"{'graph':<16}{'structure':<8}{'memory (MB)':>13}{'consistent (ms)':>17}{'solved (ms)':>13}"
+          f"{'fc (us)':>9}{'value (us)':>12}")
+    for n_regions in ARRAY_GRAPH_SIZES:
+        graph = get_delaunay_graph(n_regions)
+        search = local_search.MinConflicts(graph, [range(N_COLORS)] * n_regions, random.Random(0))
+        search.solve()
+        variable = n_regions // 2
+        rng = random.Random(0)
+
+        def build_dicts():
+            return ({vertex: set(neighbors) for vertex, neighbors in graph.items()},
+                    dict(enumerate(search.assignment)), [list(range(N_COLORS)) for _ in range(n_regions)])
+
+        def build_arrays():
+            return utils.to_csr(graph), utils.to_assignment_array(search.assignment, N_COLORS), \
+                utils.to_domain_array([range(N_COLORS)] * n_regions, N_COLORS)
+        (dict_graph, pairs, domains), dict_memory = get_peak_memory(build_dicts)
+        ((indptr, indices), assignment, domain_array), array_memory = get_peak_memory(build_arrays)
+        sources = utils.get_edge_sources(indptr)
+        partial_pairs, partial_assignment = dict(pairs), assignment.copy()
+        for neighbor in graph[variable]:
+            partial_pairs[neighbor] = None
+            partial_assignment[neighbor] = utils.NO_VALUE
+        rows = [
+            ('dicts', dict_memory, lambda: utils.is_consistent(dict_graph, pairs),
+             lambda: utils.is_solved(dict_graph, pairs),
+             lambda: utils.forward_check(dict_graph, partial_pairs, domains, variable, 0),
+             lambda: utils.get_chosen_value(dict_graph, partial_pairs, domains, variable, rng)),
+            ('arrays', array_memory, lambda: utils.is_consistent_array(indptr, indices, assignment, sources),
+             lambda: utils.is_solved_array(indptr, indices, assignment, sources),
+             lambda: utils.forward_check_array(indptr, indices, partial_assignment, domain_array, variable, 0),
+             lambda: utils.get_chosen_value_array(indptr, indices, partial_assignment, domain_array, variable, rng)),
+        ]
+        results = []
+        for structure, memory, is_consistent, is_solved, forward_check, get_chosen_value in rows:
+            results.append((is_consistent(), is_solved()))
+            print(f"{f'delaunay-{n_regions}':<16}{structure:<8}{memory / 2 ** 20:>13.1f}"
+                  f"{time_check(is_consistent) * 1e3:>17.3f}{time_check(is_solved) * 1e3:>13.3f}"
+                  f"{time_check(forward_check) * 1e6:>9.1f}{time_check(get_chosen_value) * 1e6:>12.1f}")
+        all_equal = all_equal and results[0] == results[1]
+    for n_colors in ARRAY_CHECK_N_COLORS:
+        same_checks = check_array_versions(get_delaunay_graph(ARRAY_CHECK_GRAPH_SIZE), n_colors)
+        print(f"{n_colors} colors: array checks " + ("agree" if same_checks else "DISAGREE"))
+        all_equal = all_equal and same_checks
+    return all_equal
+
+
+def get_edited_images(image, n_edits, seed=0):
+    """
+        returns n_edits copies of the map image, each with one random edit of about INCREMENTAL_EDIT_SIZE pixels:
+        a border line that splits regions, a filled square that merges them, or an erased square
+    """
+    rng = np.random.default_rng(seed)
+    height, width = image.shape[:2]
+    half_size = INCREMENTAL_EDIT_SIZE // 2
+    edited_images = []
+    for edit in range(n_edits):
+        edited_image = image.copy()
+        x, y = int(rng.integers(half_size, width - half_size)), int(rng.integers(half_size, height - half_size))
+        if edit % 3 == 0:
+            cv2.line(edited_image, (x - half_size, y), (x + half_size, y), (0, 0, 0), 3)
+        else:
+            color = (120, 120, 120) if edit % 3 == 1 else (255, 255, 255)
+            cv2.rectangle(edited_image, (x - half_size, y - half_size), (x + half_size, y + half_size), color, -1)
+        edited_images.append(edited_image)
+    return edited_images
+
+
+def get_random_diff(graph, rng):
+    """
+        returns a diff for incremental.apply_diff() that looks like a small edit of a map: two regions removed,
+        three new regions each bordering a region and some of its neighbors, and a few edges added or removed
+    """
+    n_variables = len(graph)
+    diff = {'added_nodes': 3, 'removed_nodes': rng.sample(range(n_variables), 2), 'added_edges': [],
+            'removed_edges': []}
+    for new_variable in range(n_variables, n_variables + 3):
+        anchor = rng.randrange(n_variables)
+        diff['added_edges'] += [(variable, new_variable) for variable in [anchor] + sorted(graph[anchor])[:3]]
+    for _ in range(10):
+        variable = rng.randrange(n_variables)
+        second_neighbors = {far for neighbor in graph[variable] for far in graph[neighbor]} - graph[variable]
+        second_neighbors.discard(variable)
+        if second_neighbors:
+            diff['added_edges'].append((variable, rng.choice(sorted(second_neighbors))))
+        if graph[variable]:
+            diff['removed_edges'].append((variable, min(graph[variable])))
+    return diff
+
+
+def benchmark_incremental(image_paths):
+    """
+        compares the incremental update of a colored map after a small edit, Map.update_patch() followed by
+        incremental.repair_coloring(), with the full preprocessing and coloring of the edited map, on the maps and
+        on synthetic Voronoi maps, then compares incremental.apply_diff() and the repair with a full coloring on
+        sparse synthetic planar graphs
+        returns False if an update extracted another graph than the full preprocessing, if a repaired coloring
+        is not valid, or if the painter of the solver, painted before the update, paints the updated map otherwise
+        than a new RegionPainter, the maps without a coloring with N_COLORS colors are only compared with the full
+        preprocessing
+    """
+    all_valid = True
+    map_options = {'vectorized': True, 'use_connected_components': True, 'use_spatial_index': True}
+    print(f"{'graph':<24}{'edit':>5}{'regions':>8}{'added':>6}{'removed':>8}{'repaired':>9}{'recolored':>10}"
+          f"{'update (s)':>11}{'repair (s)':>11}{'full (s)':>10}")
+    images = [(image_path, cv2.imread(image_path, cv2.IMREAD_COLOR)) for image_path in image_paths]
+    images += [(f'voronoi-{n_regions}', render_voronoi_map(n_regions)) for n_regions in INCREMENTAL_RENDERED_SIZES]
+    for name, image in images:
+        for edit, edited_image in enumerate(get_edited_images(image, INCREMENTAL_N_EDITS)):
+            box = incremental.get_changed_box(image, edited_image)
+            if box is None:
+                continue
+            image_map, _ = preprocess_image(image.copy(), **map_options)
+            solver = Solver({node.id: set(node.adj) for node in image_map.nodes}, use_peeling=True,
+                            image_map=image_map)
+            colored = solver.solve().solved
+            solver.paint_map()
+            result = incremental.update_map_coloring(image_map, solver.graph, solver.colored_states, edited_image, box)
+            solver.paint_map()
+            painter = RegionPainter(image_map.image.copy(), image_map.mark, len(image_map.nodes),
+                                    solver.painter.colors)
+            painter.paint([-1 if solver.colored_states[i] is None else solver.colored_states[i]
+                           for i in range(len(image_map.nodes))])
+            same_paint = np.array_equal(painter.image, image_map.image)
+            start_time = time.perf_counter()
+            edited_map, _ = preprocess_image(edited_image.copy(), **map_options)
+            Solver({node.id: set(node.adj) for node in edited_map.nodes}, use_peeling=True).solve()
+            full_time = time.perf_counter() - start_time
+            positions = [(node.x, node.y) for node in image_map.nodes]
+            edited_positions = [(node.x, node.y) for node in edited_map.nodes]
+            same_graph = sorted(positions) == sorted(edited_positions) and \
+                {frozenset((positions[node.id], positions[adj])) for node in image_map.nodes for adj in node.adj} == \
+                {frozenset((edited_positions[node.id], edited_positions[adj]))
+                 for node in edited_map.nodes for adj in node.adj}
+            valid = not colored or result.solved and utils.is_solved(solver.graph, solver.colored_states)
+            all_valid = all_valid and same_graph and valid and same_paint
+            print(f"{name:<24}{edit:>5}{len(image_map.nodes):>8}{result.stats['added_nodes']:>6}"
+                  f"{result.stats['removed_nodes']:>8}{result.stats['repaired']:>9}{result.stats['recolored']:>10}"
+                  f"{result.stats['update_time']:>11.3f}{result.stats['time']:>11.3f}{full_time:>10.3f}"
+                  + ("" if same_graph else "  GRAPH MISMATCH") + ("" if valid else "  INVALID")
+                  + ("" if same_paint else "  PAINT MISMATCH")
+                  + ("" if colored else "  NOT COLORABLE"))
+    rng = random.Random(0)
+    for n_regions in INCREMENTAL_GRAPH_SIZES:
+        graph = get_sparse_planar_graph(n_regions, PEELING_KEPT_EDGE_RATIOS[1])
+        start_time = time.perf_counter()
+        assignment = Solver(graph, use_peeling=True, decomposition=decomposition.BLOCKS).solve().assignment
+        full_time = time.perf_counter() - start_time
+        for edit in range(INCREMENTAL_N_EDITS):
+            diff = get_random_diff(graph, rng)
+            start_time = time.perf_counter()
+            _, variables = incremental.apply_diff(graph, assignment, diff)
+            result = incremental.repair_coloring(graph, assignment, variables)
+            update_time = time.perf_counter() - start_time - result.stats['time']
+            valid = result.solved and utils.is_solved(graph, assignment)
+            all_valid = all_valid and valid
+            print(f"{f'planar-{n_regions}':<24}{edit:>5}{len(graph):>8}{diff['added_nodes']:>6}"
+                  f"{len(diff['removed_nodes']):>8}{result.stats['repaired']:>9}{result.stats['recolored']:>10}"
+                  f"{update_time:>11.3f}{result.stats['time']:>11.3f}{full_time:>10.3f}"
+                  + ("" if valid else "  INVALID"))
+    return all_valid
+
+
+def benchmark_rendering(image_paths):
+    """
+        compares the time of one frame painted by Map.change_region_color() on every region with the RegionPainter
+        palette lookup, for a frame where every region changed color and for a frame where only one region did,
+        on the labelled maps and on synthetic Voronoi maps, the large ones labelled in tiles
+        returns False if the two painted another image
+    """
+    all_equal = True
+    print(f"{'map':<24}{'regions':>8}{'pixels':>10}{'loop (ms)':>11}{'palette (ms)':>14}{'one region (ms)':>17}")
+    images = [(image_path, cv2.imread(image_path, cv2.IMREAD_COLOR)) for image_path in image_paths]
+    images += [(f'voronoi-{n_regions}', render_voronoi_map(n_regions)) for n_regions in RENDERING_RENDERED_SIZES]
+    colors = COLORING_COLORS + [NONE_COLOR]
+    for name, image in images:
+        is_large_image = image.shape[0] > MAXIMUM_IMAGE_HEIGHT or image.shape[1] > MAXIMUM_IMAGE_WIDTH
+        image_map = Map(image, vectorized=True, use_connected_components=True, tiled=is_large_image)
+        if is_large_image:
+            image_map.filter_image_tiled()
+        else:
+            image_map.filter_image()
+        image_map.find_graph_nodes()
+        n_regions = len(image_map.nodes)
+        painter = RegionPainter(image_map.image.copy(), image_map.mark, n_regions, colors)
+        rng = np.random.default_rng(0)
+        loop_time = palette_time = one_region_time = 0
+        for _ in range(RENDERING_N_FRAMES):
+            color_indices = rng.integers(-1, N_COLORS, n_regions)
+            start_time = time.perf_counter()
+            for node, color_index in zip(image_map.nodes, color_indices.tolist()):
+                image_map.change_region_color(node, colors[color_index])
+            loop_time += time.perf_counter() - start_time
+            painter.color_indices[:] = -2
+            start_time = time.perf_counter()
+            painter.paint(color_indices)
+            palette_time += time.perf_counter() - start_time
+            color_indices[rng.integers(n_regions)] = N_COLORS - 1 - color_indices[rng.integers(n_regions)]
+            start_time = time.perf_counter()
+            painter.paint(color_indices)
+            one_region_time += time.perf_counter() - start_time
+            for node, color_index in zip(image_map.nodes, color_indices.tolist()):
+                image_map.change_region_color(node, colors[color_index])
+            all_equal = all_equal and np.array_equal(image_map.image, painter.image)
+        print(f"{name:<24}{n_regions:>8}{image.shape[0] * image.shape[1]:>10}"
+              f"{loop_time / RENDERING_N_FRAMES * 1e3:>11.2f}{palette_time / RENDERING_N_FRAMES * 1e3:>14.2f}"
+              f"{one_region_time / RENDERING_N_FRAMES * 1e3:>17.3f}"
+              + ("" if np.array_equal(image_map.image, painter.image) else "  IMAGE MISMATCH"))
+    return all_equal
+
+
+def benchmark_anytime(image_paths):
+    """
+        runs the anytime -fc and -ii searches under each of ANYTIME_TIME_LIMITS on the maps, on random planar
+        triangulations and on sparser random planar graphs, and reports the conflicting edges of the coloring they
+        return and their wall time, which adds the setup of the search and the completion of the assignment to the
+        time limit, then the number of colors minimize_colors() gets down to within the same time limits
+        returns False if a search returned an incomplete assignment, or if a minimized coloring is not valid
+    """
+    graphs = [(image_path, get_map_graph(image_path)) for image_path in image_paths]
+    graphs += [(f'delaunay-{n_regions}', get_delaunay_graph(n_regions)) for n_regions in ANYTIME_GRAPH_SIZES]
+    graphs += [(f'planar-{n_regions}', get_sparse_planar_graph(n_regions, PEELING_KEPT_EDGE_RATIOS[1]))
+               for n_regions in ANYTIME_GRAPH_SIZES]
+    all_valid = True
+    print(f"{'graph':<24}{'limit (s)':>10}" + ''.join(f"{f'{mode} conflicts':>14}{'time (s)':>10}"
+                                                       for mode in ANYTIME_MODES)
+          + f"{'colors':>8}{'bounds':>8}{'optimal':>9}{'time (s)':>10}")
+    for name, graph in graphs:
+        for time_limit in ANYTIME_TIME_LIMITS:
+            rows = []
+            for mode in ANYTIME_MODES:
+                start_time = time.perf_counter()
+                result = Solver(graph, filtering_mode=mode, time_limit=time_limit, max_steps=None,
+                                anytime=True).solve()
+                elapsed_time = time.perf_counter() - start_time
+                all_valid = all_valid and all(color is not None for color in result.assignment.values())
+                rows.append((result.stats.get('conflicts', 0), elapsed_time))
+            result = minimize.minimize_colors(graph, time_limit=time_limit)
+            all_valid = all_valid and utils.is_solved(graph, result.assignment)
+            print(f"{name:<24}{time_limit:>10.1f}" + ''.join(f"{n_conflicts:>14}{elapsed_time:>10.3f}" for n_conflicts, elapsed_time in rows)
+                  + f"{result.stats['n_colors']:>8}{result.stats['lower_bound']:>4}-{result.stats['upper_bound']:<3}"
+                  f"{str(result.stats['optimal']):>9}{result.stats['time']:>10.3f}")
+    return all_valid
+
+
+def benchmark_batch(image_paths):
+    """
+        colors the maps with batch.run_batch() in a directory that also holds BAD_MAP_NAME, a file that is not an
+        image, and a copy of the first map with the same name in COPIES_DIRECTORY, then runs the batch again to
+        resume it, and colors one map with a configuration the Solver rejects
+        returns False if the bad map stopped the batch or did not get an ERROR row with its message, if another map
+        failed, if two maps were written to the same output, or if the resumed batch processed anything but the bad
+        map again
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        for image_path in image_paths:
+            shutil.copy(image_path, directory)
+        copies_directory = os.path.join(directory, COPIES_DIRECTORY)
+        os.makedirs(copies_directory)
+        shutil.copy(image_paths[0], copies_directory)
+        bad_map_path = os.path.join(directory, BAD_MAP_NAME)
+        with open(bad_map_path, 'wb') as bad_map_file:
+            bad_map_file.write(b'not an image')
+        batch_paths = batch.get_image_paths(directory) + batch.get_image_paths(copies_directory)
+        output_directory = os.path.join(directory, batch.OUTPUT_DIRECTORY)
+        start_time = time.perf_counter()
+        rows = batch.run_batch(batch_paths, output_directory, max_workers=BATCH_WORKERS, use_cache=False)
+        batch_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        resumed_rows = batch.run_batch(batch_paths, output_directory, max_workers=BATCH_WORKERS, use_cache=False)
+        resume_time = time.perf_counter() - start_time
+        rejected_row = batch.process_map(os.path.join(directory, os.path.basename(image_paths[0])),
+                                         os.path.join(output_directory, 'rejected.png'), {'n_colours': N_COLORS})
+    finally:
+        shutil.rmtree(directory)
+    bad_rows = [row for row in rows if row['map'] == bad_map_path]
+    valid = len(rows) == len(image_paths) + 2 and len(bad_rows) == 1 and bad_rows[0]['status'] == batch.ERROR and \
+        bad_rows[0]['message'] != '' and all(row['status'] != batch.ERROR for row in rows if row not in bad_rows) and \
+        len({row['output'] for row in rows}) == len(rows) and \
+        [row['map'] for row in resumed_rows] == [bad_map_path] and \
+        rejected_row['status'] == batch.ERROR and 'n_colours' in rejected_row['message']
+    print(f"{len(rows)} maps in {batch_time:.3f}s, resumed {len(resumed_rows)} in {resume_time:.3f}s, "
+          f"rejected configuration: {rejected_row['message']}" + ("" if valid else "  INVALID"))
+    return valid
+
+
+def measure(function):
+    """
+        runs function once for its wall time, and once more under tracemalloc for its peak memory in bytes,
+        since tracing slows the allocations down
+        returns the result of the first run, the seconds and the peak memory
+    """
+    start_time = time.perf_counter()
+    result = function()
+    elapsed_time = time.perf_counter() - start_time
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed_time, peak_memory
+
+
+def run_suite_search(graph, filtering_mode, use_variable_ordering, use_value_ordering):
+    """
+        runs one solver configuration within SUITE_NODE_LIMIT nodes, or SUITE_MAX_STEPS steps for -ii
+        returns the result ('solved', 'failed', 'limit' or 'INVALID'), the number of nodes or steps, and the number
+        of colors of the coloring found (0 if none was)
+    """
+    domains = [list(range(N_COLORS)) for _ in range(len(graph))]
+    if filtering_mode == '-ii':
+        search = local_search.MinConflicts(graph, domains, random.Random(0))
+        solved = search.solve(SUITE_MAX_STEPS)
+        nodes = search.steps
+    else:
+        search = csp.ColoringCSP(graph, N_COLORS, domains, filtering_mode, use_variable_ordering,
+                                 use_value_ordering, node_limit=SUITE_NODE_LIMIT)
+        solved = search.solve()
+        nodes = search.expanded_nodes
+        solved = {True: True, False: 'failed', None: False}[solved]
+    if solved is not True:
+        return {False: 'limit', 'failed': 'failed'}[solved], nodes, 0
+    if any(search.assignment[u] == search.assignment[v] for u in graph for v in graph[u]):
+        return 'INVALID', nodes, 0
+    return 'solved', nodes, len({search.assignment[variable] for variable in graph})
+
+
+def find_regressions(results, baseline):
+    """
+        compares every row of results with the same row of baseline, and returns the description of each regression:
+        a solved search that is not solved anymore, more nodes, more colors, and, only if the baseline has times and
+        memory, more than TIME_REGRESSION_THRESHOLD and MINIMUM_TIME_REGRESSION seconds slower, or more than
+        MEMORY_REGRESSION_THRESHOLD and MINIMUM_MEMORY_REGRESSION bytes more memory
+    """
+    regressions = []
+    for name, row in results.items():
+        baseline_row = baseline.get(name)
+        if baseline_row is None:
+            continue
+        if baseline_row['result'] == 'solved' and row['result'] != 'solved':
+            regressions.append(f"{name}: {baseline_row['result']} -> {row['result']}")
+        if row['nodes'] > baseline_row['nodes']:
+            regressions.append(f"{name}: {baseline_row['nodes']} -> {row['nodes']} nodes")
+        if row['colors'] > baseline_row.get('colors', row['colors']):
+            regressions.append(f"{name}: {baseline_row['colors']} -> {row['colors']} colors")
+        if 'time' in baseline_row and row['time'] > baseline_row['time'] * (1 + TIME_REGRESSION_THRESHOLD) and \
+                row['time'] - baseline_row['time'] > MINIMUM_TIME_REGRESSION:
+            regressions.append(f"{name}: {baseline_row['time']:.3f}s -> {row['time']:.3f}s")
+        if 'memory' in baseline_row and \
+                row['memory'] > baseline_row['memory'] * (1 + MEMORY_REGRESSION_THRESHOLD) and \
+                row['memory'] - baseline_row['memory'] > MINIMUM_MEMORY_REGRESSION:
+            regressions.append(f"{name}: {baseline_row['memory'] / 2 ** 20:.1f} MB -> "
+                               f"{row['memory'] / 2 ** 20:.1f} MB")
+    return regressions
+
+
+def benchmark_suite(image_paths, graph_sizes=SUITE_GRAPH_SIZES, rendered_sizes=SUITE_RENDERED_SIZES,
+                    baseline_path=BASELINE_PATH, save_baseline=False, local_baseline_path=LOCAL_BASELINE_PATH):
+    """
+        measures the wall time, the peak memory and the nodes (the regions for the preprocessing) of:
+        the preprocessing of the maps and of synthetic Voronoi maps of rendered_sizes regions,
+        and every solver configuration of SUITE_CONFIGS on the graphs of the maps and on synthetic planar graphs
+        of graph_sizes regions
+        with save_baseline, the BASELINE_FIELDS of the results, which do not depend on the machine, are written to
+        baseline_path, and the whole results with the times and the memory to local_baseline_path, which is not
+        committed, otherwise the results are compared with both baselines that exist
+        returns False if a search returned an invalid coloring, or if a regression was found
+    """
+    results = {}
+    print(f"{'benchmark':<44}{'result':>8}{'nodes':>8}{'time (s)':>10}{'memory (MB)':>13}")
+
+    def record(name, result, nodes, colors, elapsed_time, peak_memory):
+        results[name] = {'result': result, 'nodes': nodes, 'colors': colors, 'time': elapsed_time,
+                         'memory': peak_memory}
+        print(f"{name:<44}{result:>8}{nodes:>8}{elapsed_time:>10.3f}{peak_memory / 2 ** 20:>13.1f}")
+
+    graphs = []
+    images = [(image_path, cv2.imread(image_path, cv2.IMREAD_COLOR)) for image_path in image_paths]
+    images += [(f'voronoi-{n_regions}', render_voronoi_map(n_regions)) for n_regions in rendered_sizes]
+    for name, image in images:
+        is_large_image = image.shape[0] > MAXIMUM_IMAGE_HEIGHT or image.shape[1] > MAXIMUM_IMAGE_WIDTH
+        (image_map, _), elapsed_time, peak_memory = measure(
+            lambda: preprocess_image(image.copy(), vectorized=True, use_connected_components=True,
+                                     use_spatial_index=True, tiled=is_large_image))
+        record(f'{name} preprocessing', 'done', len(image_map.nodes), 0, elapsed_time, peak_memory)
+        if name in image_paths:
+            graphs.append((name, {node.id: set(node.adj) for node in image_map.nodes}))
+    graphs += [(f'delaunay-{n_regions}', get_delaunay_graph(n_regions)) for n_regions in graph_sizes]
+    for name, graph in graphs:
+        for filtering_mode, use_variable_ordering, use_value_ordering in SUITE_CONFIGS:
+            flags = '' if filtering_mode == '-ii' else \
+                f" {'-t' if use_variable_ordering else '-f'} {'-t' if use_value_ordering else '-f'}"
+            (result, nodes, colors), elapsed_time, peak_memory = measure(
+                lambda: run_suite_search(graph, filtering_mode, use_variable_ordering, use_value_ordering))
+            record(f'{name} {filtering_mode}{flags}', result, nodes, colors, elapsed_time, peak_memory)
+
+    regressions = []
+    if save_baseline:
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump({name: {field: row[field] for field in BASELINE_FIELDS} for name, row in results.items()},
+                      baseline_file, indent=1, sort_keys=True)
+        with open(local_baseline_path, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=1, sort_keys=True)
+        print(f"baseline saved to {baseline_path}, times and memory to {local_baseline_path}")
+    else:
+        for path in [baseline_path, local_baseline_path]:
+            if not os.path.exists(path):
+                print(f"no baseline at {path}, run with --save-baseline to store one")
+                continue
+            with open(path) as baseline_file:
+                path_regressions = find_regressions(results, json.load(baseline_file))
+            print(f"{len(path_regressions)} regressions against {path}")
+            for regression in path_regressions:
+                print(f"  {regression}")
+            regressions += path_regressions
+    return not regressions and all(row['result'] != 'INVALID' for row in results.values())
+
+
+BENCHMARKS = {
+    'preprocessing': benchmark_preprocessing,
+    'labelling': benchmark_labelling,
+    'adjacency': benchmark_adjacency,
+    'search': benchmark_search,
+    'local-search': benchmark_local_search,
+    'peeling': benchmark_peeling,
+    'arrays': benchmark_arrays,
+    'incremental': benchmark_incremental,
+    'rendering': benchmark_rendering,
+    'anytime': benchmark_anytime,
+    'batch': benchmark_batch,
+    'suite': benchmark_suite,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: python benchmark.py <{'|'.join(BENCHMARKS)}> [image_path ...]")
+        print("       python benchmark.py suite [image_path ...] [--sizes=10,100,...] [--rendered-sizes=10,100,...] "
+              "[--baseline=<path>] [--save-baseline]")
+        exit(1)
+    image_paths, options = parse_options(sys.argv[2:])
+    if sys.argv[1] == 'suite':
+        passed = benchmark_suite(
+            image_paths or BENCHMARK_MAPS,
+            [int(size) for size in options['sizes'].split(',')] if options.get('sizes') else SUITE_GRAPH_SIZES,
+            [int(size) for size in options['rendered-sizes'].split(',')] if options.get('rendered-sizes')
+            else SUITE_RENDERED_SIZES,
+            options.get('baseline') or BASELINE_PATH, 'save-baseline' in options)
+    else:
+        passed = BENCHMARKS[sys.argv[1]](image_paths or BENCHMARK_MAPS)
+    if not passed:
+        exit(1)
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import cv2
+import numpy as np
+import map as map_module
+
+CACHE_DIRECTORY = os.environ.get('MAP_COLORING_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'map-coloring'))
+MAXIMUM_CACHE_SIZE = 2 ** 30
+CACHE_VERSION = 1
+PREPROCESSING_CONSTANTS = ['MINIMUM_BORDER_WIDTH_RATIO', 'IMPORTANT_COLOR_HIGH_THRESHOLD',
+                           'IMPORTANT_COLOR_LOW_THRESHOLD', 'MINIMUM_REGION_AREA_RATIO',
+                           'MAXIMUM_NEIGHBOR_PIXEL_COLOR_DIFFERENCE', 'SHARPEN_KERNEL']
+NODES_FILE = 'nodes.json'
+LABELS_FILE = 'labels.npy'
+SEGMENTS_FILE = 'segments.npy'
+
+
+def get_cache_key(image):
+    """
+        returns the hash of the image pixels together with the preprocessing constants they were processed with
+    """
+    key = hashlib.sha256()
+    key.update(repr((CACHE_VERSION, image.shape)).encode())
+    for name in PREPROCESSING_CONSTANTS:
+        key.update(repr(np.asarray(getattr(map_module, name)).tolist()).encode())
+    key.update(np.ascontiguousarray(image).data)
+    return key.hexdigest()
+
+
+def get_entry_path(key, cache_directory=CACHE_DIRECTORY):
+    return os.path.join(cache_directory, key)
+
+
+def load_graph(key, cache_directory=CACHE_DIRECTORY):
+    """
+        returns the nodes as (id, x, y) triples, the adjacency lists, the memory-mapped label array and the border
+        segments stored for the key, or None when it is not cached
+        the border segments are None for the entries stored without them
+    """
+    entry_path = get_entry_path(key, cache_directory)
+    try:
+        with open(os.path.join(entry_path, NODES_FILE)) as nodes_file:
+            graph = json.load(nodes_file)
+        labels = np.load(os.path.join(entry_path, LABELS_FILE), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    segments_path = os.path.join(entry_path, SEGMENTS_FILE)
+    border_segments = np.load(segments_path) if os.path.exists(segments_path) else None
+    os.utime(entry_path)
+    return graph['nodes'], graph['adjacency'], labels, border_segments
+
+
+def store_graph(key, image_map, cache_directory=CACHE_DIRECTORY, maximum_size=MAXIMUM_CACHE_SIZE):
+    """
+        saves the graph of the preprocessed map under the key, then evicts the least recently used entries
+        the entry is written to a temporary directory first, so that readers never see half of it
+    """
+    os.makedirs(cache_directory, exist_ok=True)
+    entry_path = get_entry_path(key, cache_directory)
+    temporary_path = f'{entry_path}.{os.getpid()}.tmp'
+    os.makedirs(temporary_path, exist_ok=True)
+    graph = {'nodes': [[node.id, int(node.x), int(node.y)] for node in image_map.nodes],
+             'adjacency': [[int(adj) for adj in node.adj] for node in image_map.nodes]}
+    with open(os.path.join(temporary_path, NODES_FILE), 'w') as nodes_file:
+        json.dump(graph, nodes_file)
+    np.save(os.path.join(temporary_path, LABELS_FILE), np.asarray(image_map.mark, dtype=np.int32))
+    if image_map.border_segments is not None:
+        np.save(os.path.join(temporary_path, SEGMENTS_FILE), image_map.border_segments)
+    try:
+        os.rename(temporary_path, entry_path)
+    except OSError:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+    evict(maximum_size, cache_directory)
+
+
+def get_entries(cache_directory=CACHE_DIRECTORY):
+    """
+        returns (last access time, size in bytes, path) of every cache entry, the least recently used first
+    """
+    if not os.path.isdir(cache_directory):
+        return []
+    entries = []
+    for name in os.listdir(cache_directory):
+        entry_path = os.path.join(cache_directory, name)
+        if os.path.isdir(entry_path) and not name.endswith('.tmp'):
+            size = sum(os.path.getsize(os.path.join(entry_path, file_name)) for file_name in os.listdir(entry_path))
+            entries.append((os.path.getmtime(entry_path), size, entry_path))
+    return sorted(entries)
+
+
+def evict(maximum_size=MAXIMUM_CACHE_SIZE, cache_directory=CACHE_DIRECTORY):
+    entries = get_entries(cache_directory)
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry_path in entries:
+        if total_size <= maximum_size:
+            break
+        shutil.rmtree(entry_path, ignore_errors=True)
+        total_size -= size
+
+
+def invalidate(key=None, cache_directory=CACHE_DIRECTORY):
+    """
+        removes the entry of the key, or the whole cache when no key is given
+    """
+    if key is None:
+        shutil.rmtree(cache_directory, ignore_errors=True)
+    else:
+        shutil.rmtree(get_entry_path(key, cache_directory), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == 'clear':
+        invalidate()
+        print(f"cleared {CACHE_DIRECTORY}")
+    elif len(sys.argv) == 3 and sys.argv[1] == 'invalidate':
+        image = cv2.imread(sys.argv[2], cv2.IMREAD_COLOR)
+        if image is None:
+            print("Could not read the specified image")
+            exit(1)
+        invalidate(get_cache_key(image))
+        print(f"invalidated {sys.argv[2]}")
+    elif len(sys.argv) == 2 and sys.argv[1] == 'info':
+        entries = get_entries()
+        print(f"{CACHE_DIRECTORY}: {len(entries)} entries, {sum(size for _, size, _ in entries) / 2 ** 20:.1f} MB")
+    else:
+        print("usage: python cache.py <clear|info|invalidate <image_path>>")
+        exit(1)
@@ -0,0 +1,416 @@
+import time
+import heapq
+from collections import deque
+
+STOP_CHECK_INTERVAL = 256
+AC3 = 'ac3'
+AC2001 = 'ac2001'
+MRV = 'mrv'
+DSATUR = 'dsatur'
+HEAP_REBUILD_FACTOR = 4
+TIMED_HELPERS = ['get_next_variable', 'get_chosen_variable', 'get_ordered_domain', 'forward_check', 'ac3']
+
+
+def to_bitmask(values):
+    mask = 0
+    for value in values:
+        mask |= 1 << value
+    return mask
+
+
+def from_bitmask(mask):
+    values = []
+    value = 0
+    while mask:
+        if mask & 1:
+            values.append(value)
+        mask >>= 1
+        value += 1
+    return values
+
+
+class BitmaskTable(dict):
+    """
+        maps each domain bitmask looked up so far to function(mask), computed on its first lookup, so that only the
+        masks a search meets are stored instead of a table of all the 2 ** n_colors of them
+    """
+    def __init__(self, function):
+        super().__init__()
+        self.function = function
+
+    def __missing__(self, mask):
+        result = self[mask] = self.function(mask)
+        return result
+
+
+class ColoringCSP:
+    """
+        the search core behind backtrack_solve()
+        every domain is an integer bitmask of the colors left for its variable, and the domain changes are pushed
+        on a trail so that a backtrack restores them instead of copying all the domains at every value
+        the number of assigned variables and of conflicting edges are kept up to date on each assignment,
+        which makes is_solved() and is_consistent() O(1)
+        ac_algorithm chooses how the -ac mode revises an arc, with AC3 or with the residual supports of AC2001
+        with time_helpers, the calls and the seconds spent in each of TIMED_HELPERS are added up in helper_times,
+        which slows the search down a little, so it is off by default
+        backtrack_count counts each rejected value once: a node that is a dead end (dead_ends),
+        or a value whose forward check emptied the domain of a neighbor (wipeouts)
+        with use_variable_ordering, the next variable is the one with the smallest key of variable_heuristic,
+        MRV (minimum remaining values, then degree) or DSATUR (most distinct colors among the neighbors, then degree)
+        the keys live in a heap, where a variable is pushed again whenever its key changes and outdated entries are
+        skipped when they reach the top, so that choosing a variable costs O(log V) instead of a scan of all of them
+    """
+    def __init__(self, graph, n_colors, domains, filtering_mode, use_variable_ordering, use_value_ordering,
+                 on_change=None, node_limit=None, should_stop=None, ac_algorithm=AC3, time_helpers=False,
+                 variable_heuristic=MRV):
+        self.n_variables = len(graph)
+        self.neighbors = [tuple(graph[variable]) for variable in range(self.n_variables)]
+        self.domains = [to_bitmask(domain) for domain in domains]
+        self.values = BitmaskTable(from_bitmask)
+        self.domain_size = BitmaskTable(lambda mask: len(self.values[mask]))
+        self.assignment = [None] * self.n_variables
+        self.unassigned_degree = [len(neighbors) for neighbors in self.neighbors]
+        self.trail = []
+        self.n_assigned = 0
+        self.n_conflicts = 0
+        self.filtering_mode = filtering_mode
+        self.use_variable_ordering = use_variable_ordering
+        self.use_value_ordering = use_value_ordering
+        self.on_change = on_change
+        self.node_limit = node_limit
+        self.should_stop = should_stop
+        self.ac_algorithm = ac_algorithm
+        self.variable_heuristic = variable_heuristic
+        self.n_colors = n_colors
+        self.use_saturation = use_variable_ordering and variable_heuristic == DSATUR
+        self.neighbor_colors = [[0] * n_colors for _ in range(self.n_variables)] if self.use_saturation else None
+        self.saturation = [0] * self.n_variables
+        self.heap = None
+        if use_variable_ordering:
+            self.rebuild_heap()
+        self.residues = {}
+        self.last_assigned = None
+        self.backtrack_count = 0
+        self.dead_ends = 0
+        self.wipeouts = 0
+        self.expanded_nodes = 0
+        self.assignments = 0
+        self.max_depth = 0
+        self.deepest_assignment = [None] * self.n_variables
+        self.deepest_depth = 0
+        self.revisions = 0
+        self.support_checks = 0
+        self.pruned_values = 0
+        self.helper_times = {}
+        if time_helpers:
+            for name in TIMED_HELPERS:
+                setattr(self, name, self.time_helper(name, getattr(self, name)))
+
+    def time_helper(self, name, helper):
+        """
+            returns the helper wrapped so that its calls and running time are added to helper_times[name]
+        """
+        helper_time = self.helper_times[name] = {'calls': 0, 'time': 0.0}
+
+        def timed_helper(*arguments):
+            start_time = time.perf_counter()
+            result = helper(*arguments)
+            helper_time['time'] += time.perf_counter() - start_time
+            helper_time['calls'] += 1
+            return result
+        return timed_helper
+
+    def get_stats(self):
+        return {'expanded_nodes': self.expanded_nodes, 'assignments': self.assignments, 'max_depth': self.max_depth,
+                'backtrack_count': self.backtrack_count, 'dead_ends': self.dead_ends, 'wipeouts': self.wipeouts,
+                'pruned_values': self.pruned_values, 'revisions': self.revisions,
+                'support_checks': self.support_checks, 'helper_times': self.helper_times}
+
+    def save_deepest_assignment(self):
+        """
+            keeps a copy of the assignment when it has no conflict and more assigned variables than the one kept so
+            far, it is called before a backtrack undoes an assignment, so that only the deepest states are copied
+        """
+        if self.n_conflicts == 0 and self.n_assigned > self.deepest_depth:
+            self.deepest_assignment = self.assignment[:]
+            self.deepest_depth = self.n_assigned
+
+    def get_deepest_assignment(self):
+        """
+            returns the deepest partial assignment without conflicts the search went through
+        """
+        self.save_deepest_assignment()
+        return self.deepest_assignment
+
+    def get_variable_key(self, variable):
+        if self.variable_heuristic == DSATUR:
+            return -self.saturation[variable], -self.unassigned_degree[variable], variable
+        if self.filtering_mode == '-n':
+            degree = len(self.neighbors[variable]) - self.unassigned_degree[variable]
+        else:
+            degree = self.unassigned_degree[variable]
+        return self.domain_size[self.domains[variable]], -degree, variable
+
+    def push_variable(self, variable):
+        """
+            called whenever the key of the variable may have changed, the entry with its old key becomes outdated
+        """
+        if self.heap is not None and self.assignment[variable] is None:
+            heapq.heappush(self.heap, self.get_variable_key(variable))
+
+    def rebuild_heap(self):
+        self.heap = [self.get_variable_key(variable) for variable in range(self.n_variables)
+                     if self.assignment[variable] is None]
+        heapq.heapify(self.heap)
+
+    def is_consistent(self):
+        return self.n_conflicts == 0
+
+    def is_solved(self):
+        return self.n_assigned == self.n_variables and self.n_conflicts == 0
+
+    def set_domain(self, variable, mask):
+        if self.domains[variable] != mask:
+            self.trail.append((variable, self.domains[variable]))
+            self.domains[variable] = mask
+            if self.heap is not None:
+                self.push_variable(variable)
+
+    def undo(self, trail_length):
+        """
+            restores the domains that changed since the trail had the given length
+        """
+        while len(self.trail) > trail_length:
+            variable, mask = self.trail.pop()
+            self.domains[variable] = mask
+            if self.heap is not None:
+                self.push_variable(variable)
+
+    def assign(self, variable, value):
+        self.assignment[variable] = value
+        self.last_assigned = variable
+        self.n_assigned += 1
+        self.assignments += 1
+        self.max_depth = max(self.max_depth, self.n_assigned)
+        for neighbor in self.neighbors[variable]:
+            self.unassigned_degree[neighbor] -= 1
+            if self.assignment[neighbor] == value:
+                self.n_conflicts += 1
+            if self.use_saturation:
+                if self.neighbor_colors[neighbor][value] == 0:
+                    self.saturation[neighbor] += 1
+                self.neighbor_colors[neighbor][value] += 1
+            if self.heap is not None:
+                self.push_variable(neighbor)
+        self.set_domain(variable, 1 << value)
+        if self.on_change is not None:
+            self.on_change(variable, value)
+
+    def unassign(self, variable):
+        value = self.assignment[variable]
+        for neighbor in self.neighbors[variable]:
+            self.unassigned_degree[neighbor] += 1
+            if self.assignment[neighbor] == value:
+                self.n_conflicts -= 1
+            if self.use_saturation:
+                self.neighbor_colors[neighbor][value] -= 1
+                if self.neighbor_colors[neighbor][value] == 0:
+                    self.saturation[neighbor] -= 1
+            if self.heap is not None:
+                self.push_variable(neighbor)
+        self.assignment[variable] = None
+        self.n_assigned -= 1
+        self.push_variable(variable)
+        if self.on_change is not None:
+            self.on_change(variable, None)
+
+    def get_next_variable(self):
+        for variable in range(self.n_variables):
+            if self.assignment[variable] is None:
+                return variable
+
+    def get_chosen_variable(self):
+        """
+            returns the unassigned variable with the smallest key, with MRV ties broken by the degree heuristic
+            as in utils.get_chosen_variable(), and then by the lowest index
+        """
+        heap = self.heap
+        if len(heap) > HEAP_REBUILD_FACTOR * self.n_variables:
+            self.rebuild_heap()
+            heap = self.heap
+        while heap:
+            key = heap[0]
+            variable = key[2]
+            if self.assignment[variable] is None and key == self.get_variable_key(variable):
+                return variable
+            heapq.heappop(heap)
+
+    def count_constraint_for_value(self, variable, value):
+        bit = 1 << value
+        count = 0
+        for neighbor in self.neighbors[variable]:
+            if self.assignment[neighbor] is None and self.domains[neighbor] & bit:
+                count += 1
+        return count
+
+    def get_ordered_domain(self, variable):
+        """
+            least constraining value first, the counts of count_constraint_for_value() are taken for all the values
+            in one pass over the neighbors
+        """
+        mask = self.domains[variable]
+        values = self.values[mask]
+        if self.use_value_ordering:
+            counts = [0] * self.n_colors
+            for neighbor in self.neighbors[variable]:
+                if self.assignment[neighbor] is None:
+                    for value in self.values[self.domains[neighbor] & mask]:
+                        counts[value] += 1
+            values = sorted(values, key=counts.__getitem__)
+        return values
+
+    def forward_check(self, variable, value):
+        """
+            removes the value from the domains of the unassigned neighbors
+            returns True if backtracking is necessary, and False otherwise
+        """
+        bit = 1 << value
+        for neighbor in self.neighbors[variable]:
+            if self.assignment[neighbor] is None and self.domains[neighbor] & bit:
+                self.set_domain(neighbor, self.domains[neighbor] & ~bit)
+                self.pruned_values += 1
+                if not self.domains[neighbor]:
+                    return True
+        return False
+
+    def revise(self, x1, x2):
+        """
+            removes the values of x1 that have no support in x2, returns True if any value was removed
+        """
+        self.revisions += 1
+        if self.ac_algorithm == AC2001:
+            return self.revise_with_residues(x1, x2)
+        mask = self.domains[x2]
+        self.support_checks += 1
+        # with a different-colors constraint, a value of x1 has no support only if it is the single value of x2
+        if self.domain_size[mask] == 1 and self.domains[x1] & mask:
+            self.set_domain(x1, self.domains[x1] & ~mask)
+            self.pruned_values += 1
+            return True
+        return False
+
+    def revise_with_residues(self, x1, x2):
+        """
+            the AC-2001/AC-3.1 revision: the last support found for each value of x1 is checked first,
+            and a new support is only searched for when that one has left the domain of x2
+            the supports are kept across backtracks, a support that is no longer valid is simply searched again
+        """
+        x2_domain = self.domains[x2]
+        removed = 0
+        for value in self.values[self.domains[x1]]:
+            arc_value = (x1, x2, value)
+            support = self.residues.get(arc_value)
+            self.support_checks += 1
+            if support is not None and x2_domain >> support & 1:
+                continue
+            candidates = x2_domain & ~(1 << value)
+            if candidates:
+                self.residues[arc_value] = (candidates & -candidates).bit_length() - 1
+            else:
+                removed |= 1 << value
+        if removed:
+            self.set_domain(x1, self.domains[x1] & ~removed)
+            self.pruned_values += self.domain_size[removed]
+            return True
+        return False
+
+    def ac3(self, variable=None):
+        """
+            maintains arc-consistency, starting from the arcs towards variable, the one that was just assigned,
+            or from all the arcs of the unassigned variables when variable is None
+            an arc is never queued twice at the same time
+            returns True if backtracking is necessary, and False otherwise
+        """
+        if variable is None:
+            queue = deque((x1, x2) for x1 in range(self.n_variables) if self.assignment[x1] is None
+                          for x2 in self.neighbors[x1])
+        else:
+            queue = deque((neighbor, variable) for neighbor in self.neighbors[variable])
+        queued = set(queue)
+        while queue:
+            arc = queue.popleft()
+            queued.discard(arc)
+            x1, x2 = arc
+            if self.revise(x1, x2):
+                if not self.domains[x1]:
+                    return True
+                for neighbor in self.neighbors[x1]:
+                    if neighbor != x2 and (neighbor, x1) not in queued:
+                        queue.append((neighbor, x1))
+                        queued.add((neighbor, x1))
+        return False
+
+    def is_dead_end(self):
+        """
+            in -ac mode, arc consistency is established over all the arcs at the root of the search,
+            and then only propagated from each new assignment (maintaining arc consistency)
+        """
+        if self.n_conflicts:
+            return True
+        return self.filtering_mode == '-ac' and self.ac3(self.last_assigned)
+
+    def try_next_value(self, frame):
+        """
+            assigns the next value of the frame's variable that survives forward checking
+            returns False when the frame has no values left
+        """
+        variable, values, trail_length = frame[0], frame[1], frame[3]
+        while frame[2] < len(values):
+            value = values[frame[2]]
+            frame[2] += 1
+            if self.filtering_mode == '-fc' and self.forward_check(variable, value):
+                self.undo(trail_length)
+                self.wipeouts += 1
+                self.backtrack_count += 1
+                continue
+            self.assign(variable, value)
+            return True
+        return False
+
+    def solve(self):
+        """
+            returns True when the CSP is solved, with the solution in self.assignment, False when it has no solution,
+            and None when node_limit nodes were expanded, or should_stop() returned True, before either was found
+            should_stop is only called once every STOP_CHECK_INTERVAL nodes
+            the search keeps its own stack of [variable, values, next value index, trail length] frames
+            so that the depth of the search is not limited by the recursion limit
+        """
+        stack = []
+        while True:
+            if self.expanded_nodes == self.node_limit:
+                return None
+            if self.should_stop is not None and self.expanded_nodes % STOP_CHECK_INTERVAL == 0 and self.should_stop():
+                return None
+            self.expanded_nodes += 1
+            if self.is_dead_end():
+                self.dead_ends += 1
+                self.backtrack_count += 1
+            elif self.n_assigned == self.n_variables:
+                return True
+            else:
+                if self.use_variable_ordering:
+                    variable = self.get_chosen_variable()
+                else:
+                    variable = self.get_next_variable()
+                stack.append([variable, self.get_ordered_domain(variable), 0, len(self.trail)])
+            while stack:
+                frame = stack[-1]
+                if self.assignment[frame[0]] is not None:
+                    self.save_deepest_assignment()
+                    self.unassign(frame[0])
+                    self.undo(frame[3])
+                if self.try_next_value(frame):
+                    break
+                stack.pop()
+            if not stack:
+                return False
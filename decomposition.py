@@ -0,0 +1,154 @@
+from collections import deque
+
+COMPONENTS = 'components'
+BLOCKS = 'blocks'
+
+
+def get_connected_components(graph):
+    """
+        returns the connected components of the graph as lists of variables
+    """
+    seen = set()
+    components = []
+    for root in graph:
+        if root in seen:
+            continue
+        seen.add(root)
+        component = [root]
+        queue = deque([root])
+        while queue:
+            variable = queue.popleft()
+            for neighbor in graph[variable]:
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    component.append(neighbor)
+                    queue.append(neighbor)
+        components.append(component)
+    return components
+
+
+def get_blocks(graph):
+    """
+        returns the biconnected blocks of the graph as lists of variables, and the set of the articulation points
+        that join them
+        the blocks are ordered so that each of them shares at most one variable, an articulation point,
+        with all the blocks before it, which is the order merge_block_colorings() needs
+        the depth-first search keeps its own stack, so that it is not limited by the recursion limit
+    """
+    discovery, low = {}, {}
+    blocks = []
+    articulation_points = set()
+    for root in graph:
+        if root in discovery:
+            continue
+        discovery[root] = low[root] = len(discovery)
+        if not graph[root]:
+            blocks.append([root])
+            continue
+        root_children = 0
+        edge_stack = []
+        stack = [(root, None, iter(graph[root]))]
+        while stack:
+            variable, parent, neighbors = stack[-1]
+            for neighbor in neighbors:
+                if neighbor not in discovery:
+                    discovery[neighbor] = low[neighbor] = len(discovery)
+                    edge_stack.append((variable, neighbor))
+                    stack.append((neighbor, variable, iter(graph[neighbor])))
+                    if variable == root:
+                        root_children += 1
+                    break
+                if neighbor != parent and discovery[neighbor] < discovery[variable]:
+                    low[variable] = min(low[variable], discovery[neighbor])
+                    edge_stack.append((variable, neighbor))
+            else:
+                stack.pop()
+                if parent is None:
+                    continue
+                low[parent] = min(low[parent], low[variable])
+                if low[variable] >= discovery[parent]:
+                    if parent != root:
+                        articulation_points.add(parent)
+                    block = set()
+                    while True:
+                        edge = edge_stack.pop()
+                        block.update(edge)
+                        if edge == (parent, variable):
+                            break
+                    blocks.append(sorted(block))
+        if root_children > 1:
+            articulation_points.add(root)
+    # a block is found after all the blocks below it in the depth-first search tree
+    blocks.reverse()
+    return blocks, articulation_points
+
+
+def get_parts(graph, decomposition):
+    """
+        returns the parts the graph is split into by the decomposition, COMPONENTS or BLOCKS
+    """
+    if decomposition == BLOCKS:
+        return get_blocks(graph)[0]
+    return get_connected_components(graph)
+
+
+def get_subgraph(graph, part):
+    """
+        returns the graph induced by the variables of part, with the variables renumbered by their index in part
+    """
+    index = {variable: i for i, variable in enumerate(part)}
+    return {index[variable]: {index[neighbor] for neighbor in graph[variable] if neighbor in index}
+            for variable in part}
+
+
+def merge_block_colorings(parts, colorings):
+    """
+        merges the colorings of the parts, each a list of colors in the order of the variables of its part,
+        into one assignment
+        a part that shares a variable with the parts before it has its colors swapped so that the shared variable
+        keeps its color, which is enough since swapping two colors everywhere in a part keeps its coloring valid
+        the parts have to be ordered as get_blocks() returns them, connected components need no swap
+    """
+    assignment = {}
+    for part, coloring in zip(parts, colorings):
+        permutation = {}
+        for variable, color in zip(part, coloring):
+            if variable in assignment and assignment[variable] != color:
+                permutation = {color: assignment[variable], assignment[variable]: color}
+                break
+        for variable, color in zip(part, coloring):
+            assignment[variable] = permutation.get(color, color)
+    return assignment
+
+
+def peel_low_degree(graph, n_colors):
+    """
+        repeatedly removes the variables with fewer than n_colors neighbors left, since whatever colors their
+        neighbors get, one color is always left for them
+        returns the variables of the remaining core, and the removed variables in the order they were removed
+    """
+    degree = {variable: len(graph[variable]) for variable in graph}
+    queue = deque(variable for variable in graph if degree[variable] < n_colors)
+    removed = set(queue)
+    peeled = []
+    while queue:
+        variable = queue.popleft()
+        peeled.append(variable)
+        for neighbor in graph[variable]:
+            if neighbor not in removed:
+                degree[neighbor] -= 1
+                if degree[neighbor] < n_colors:
+                    removed.add(neighbor)
+                    queue.append(neighbor)
+    return [variable for variable in graph if variable not in removed], peeled
+
+
+def color_peeled(graph, assignment, peeled, n_colors):
+    """
+        colors the peeled variables in the reverse order of their removal, each with the lowest color none of
+        its neighbors has, which always exists since it had fewer than n_colors neighbors left when it was removed
+        assignment has to hold None for the peeled variables
+    """
+    for variable in reversed(peeled):
+        used_colors = {assignment[neighbor] for neighbor in graph[variable]}
+        assignment[variable] = next(color for color in range(n_colors) if color not in used_colors)
@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from solver import Solver, SolveResult, N_COLORS, SOLVED, NO_SOLUTION, STOPPED, load_map, get_graph, parse_options
+import decomposition
+import utils
+
+REPAIR_RADIUS = 0
+REPAIR_CONFIG = {'filtering_mode': '-fc', 'use_variable_ordering': True, 'use_value_ordering': True}
+OPTIONS = ['output', 'no-cache']
+
+
+def get_changed_box(image, new_image):
+    """
+        returns the smallest box (x0, y0, x1, y1), x1 and y1 excluded, around the pixels that differ between
+        the two images of the same size, or None when they are the same
+    """
+    ys, xs = np.nonzero((image != new_image).any(axis=2))
+    if len(xs) == 0:
+        return None
+    return int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1
+
+
+def apply_diff(graph, assignment, diff):
+    """
+        applies the diff to the graph and to the assignment in place, in time proportional to the size of the diff
+        diff is a dict with any of
+        added_nodes: the number of new variables, numbered after the variables of the graph, and uncolored
+        removed_nodes: the variables that are removed
+        added_edges, removed_edges: the pairs of variables that become neighbors or stop being neighbors
+        the variables of the diff are numbered before the removed variables are dropped, after which the last
+        variables take their numbers as utils.get_renumbering() gives them
+        returns the renumbering, and the variables that may now conflict with a neighbor, in the new numbering
+    """
+    n_variables = len(graph)
+    for variable in range(n_variables, n_variables + diff.get('added_nodes', 0)):
+        graph[variable] = set()
+        assignment[variable] = None
+    variables = set(range(n_variables, len(graph)))
+    for u, v in diff.get('removed_edges', []):
+        graph[u].discard(v)
+        graph[v].discard(u)
+    for u, v in diff.get('added_edges', []):
+        graph[u].add(v)
+        graph[v].add(u)
+        variables.update((u, v))
+    removed = set(diff.get('removed_nodes', []))
+    renumbering = utils.get_renumbering(len(graph), removed)
+    for variable in removed:
+        for neighbor in graph.pop(variable):
+            if neighbor not in removed:
+                graph[neighbor].discard(variable)
+        del assignment[variable]
+    for old_variable, new_variable in renumbering.items():
+        neighbors = graph.pop(old_variable)
+        for neighbor in neighbors:
+            graph[neighbor].discard(old_variable)
+            graph[neighbor].add(new_variable)
+        graph[new_variable] = neighbors
+        assignment[new_variable] = assignment.pop(old_variable)
+    return renumbering, {renumbering.get(variable, variable) for variable in variables - removed}
+
+
+def get_conflicted(graph, assignment, variables):
+    """
+        returns the variables of variables that are uncolored or have the color of one of their neighbors
+    """
+    return {variable for variable in variables if assignment[variable] is None or
+            any(assignment[neighbor] == assignment[variable] for neighbor in graph[variable])}
+
+
+def get_neighborhood(graph, variables, radius):
+    """
+        returns the variables at most radius edges away from one of variables
+    """
+    neighborhood = set(variables)
+    frontier = list(variables)
+    for _ in range(radius):
+        next_frontier = []
+        for variable in frontier:
+            for neighbor in graph[variable]:
+                if neighbor not in neighborhood:
+                    neighborhood.add(neighbor)
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+    return neighborhood
+
+
+def repair_coloring(graph, assignment, variables, config=None, radius=REPAIR_RADIUS):
+    """
+        colors again only the neighborhood of the variables of variables that are uncolored or conflicting:
+        the variables at most radius edges away from them are solved by a Solver of config (REPAIR_CONFIG by
+        default), each with the colors its other neighbors leave it, and the radius grows to 1 then doubles
+        while that fails, until the neighborhood covers their whole connected components
+        config cannot use decomposition or use_peeling, and assignment is updated in place
+        returns a SolveResult with assignment, and the number of conflicted, repaired and recolored variables
+    """
+    start_time = time.perf_counter()
+    config = dict(REPAIR_CONFIG, **(config or {}))
+    n_colors = config.get('n_colors', N_COLORS)
+    conflicted = get_conflicted(graph, assignment, variables)
+    stats = {'conflicted': len(conflicted), 'radius': 0, 'repaired': 0, 'recolored': 0, 'searches': 0}
+    status = SOLVED
+    while conflicted:
+        neighborhood = get_neighborhood(graph, conflicted, radius)
+        if len(neighborhood) == stats['repaired']:
+            break
+        part = sorted(neighborhood)
+        domains = []
+        for variable in part:
+            used_colors = {assignment[neighbor] for neighbor in graph[variable] if neighbor not in neighborhood}
+            domains.append([color for color in range(n_colors) if color not in used_colors])
+        stats.update(radius=radius, repaired=len(part))
+        status = NO_SOLUTION
+        if all(domains):
+            stats['searches'] += 1
+            result = Solver(decomposition.get_subgraph(graph, part), domains=domains, **config).solve()
+            status = result.status
+            if result.solved:
+                for i, variable in enumerate(part):
+                    stats['recolored'] += assignment[variable] != result.assignment[i]
+                    assignment[variable] = result.assignment[i]
+                break
+            if status == STOPPED:
+                break
+        radius = max(2 * radius, 1)
+    stats['time'] = time.perf_counter() - start_time
+    return SolveResult(status, assignment, stats)
+
+
+def update_map_coloring(image_map, graph, assignment, image, box, config=None):
+    """
+        updates the map for image, which only differs from the image of the map inside box, with
+        Map.update_patch(), then applies the changes to the graph and to the assignment and repairs the coloring
+        around them with repair_coloring()
+        returns the SolveResult of the repair, whose statistics also count the changes of the graph
+    """
+    diff = image_map.update_patch(image, *box)
+    _, variables = apply_diff(graph, assignment, diff)
+    result = repair_coloring(graph, assignment, variables, config)
+    result.stats.update((name, len(value) if isinstance(value, list) else value) for name, value in diff.items())
+    result.stats['update_time'] = image_map.stage_times['update']
+    return result
+
+
+if __name__ == "__main__":
+    arguments, options = parse_options(sys.argv[1:])
+    if len(arguments) != 2 or any(name not in OPTIONS for name in options):
+        print("usage: python incremental.py <map_image_path> <new_map_image_path> [--output=<path>] [--no-cache]")
+        exit(1)
+    map_image_path, new_map_image_path = arguments
+    output_path = options.get('output') or os.path.splitext(new_map_image_path)[0] + '_colored.png'
+    image, new_image = cv2.imread(map_image_path, cv2.IMREAD_COLOR), cv2.imread(new_map_image_path, cv2.IMREAD_COLOR)
+    if image is None or new_image is None:
+        print("Could not read the specified images")
+        exit(1)
+    if image.shape != new_image.shape:
+        print("Error: the two images must have the same dimensions.")
+        exit(1)
+
+    image_map = load_map(map_image_path, use_cache='no-cache' not in options)
+    solver = Solver(get_graph(image_map), image_map=image_map)
+    result = solver.solve()
+    if not result.solved:
+        print(result.status)
+        exit(1)
+    print(f"first coloring: {result.stats['time']:.3f}s")
+    box = get_changed_box(image, new_image)
+    if box is None:
+        print("the images are the same")
+    else:
+        result = update_map_coloring(image_map, solver.graph, solver.colored_states, new_image, box)
+        print(f"changed box: {box}")
+        print(f"added regions: {result.stats['added_nodes']}, removed regions: {result.stats['removed_nodes']}, "
+              f"added edges: {result.stats['added_edges']}, removed edges: {result.stats['removed_edges']}")
+        print(f"update: {result.stats['update_time']:.3f}s, repair: {result.stats['time']:.3f}s, "
+              f"repaired regions: {result.stats['repaired']}, recolored regions: {result.stats['recolored']}")
+        print(result.status)
+        if not result.solved:
+            exit(1)
+    solver.show_solution(output_path)
+    print(f"colored map saved to {output_path}")
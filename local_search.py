@@ -0,0 +1,207 @@
+import time
+import random
+
+STOP_CHECK_INTERVAL = 256
+TABU_TENURE = 7
+RESTART_STEPS = 20000
+
+
+class MinConflicts:
+    """
+        the local search behind iterative_improvement_solve()
+        the number of conflicting neighbors of every variable is kept up to date on each move, together with the set
+        of the conflicted variables, so that a move costs O(degree) instead of a scan of every edge
+        a variable is not moved back to the value it just left for tabu_tenure steps, unless that value improves it
+        more than any other, or every other value would make it worse, and with use_breakout the weight of the conflicting edges of a variable grows whenever it cannot improve,
+        so that the search is pushed out of local minima
+        the search restarts from a new random assignment when restart_steps steps go by without a new best
+        the moves made since the best assignment of the current restart are logged, so that get_best_assignment()
+        can undo them instead of copying the assignment at each new best
+    """
+    def __init__(self, graph, domains, rng=None, tabu_tenure=TABU_TENURE, use_breakout=True,
+                 restart_steps=RESTART_STEPS, on_change=None, on_restart=None):
+        self.n_variables = len(graph)
+        self.neighbors = [tuple(graph[variable]) for variable in range(self.n_variables)]
+        self.domains = [tuple(domain) for domain in domains]
+        self.random = rng if rng is not None else random.Random()
+        self.tabu_tenure = tabu_tenure
+        self.use_breakout = use_breakout
+        self.restart_steps = restart_steps
+        self.on_change = on_change
+        self.on_restart = on_restart
+        self.assignment = [None] * self.n_variables
+        self.conflicts = [0] * self.n_variables
+        self.conflicted = []
+        self.position = [-1] * self.n_variables
+        self.n_conflicts = 0
+        self.weights = {}
+        self.tabu_until = {}
+        self.steps = 0
+        self.restarts = 0
+        self.best_conflicts = None
+        self.solution_time = None
+        self.moves_since_best = None
+        self.best_assignment = None
+        self.least_conflicts = None
+
+    def add_conflicted(self, variable):
+        self.position[variable] = len(self.conflicted)
+        self.conflicted.append(variable)
+
+    def remove_conflicted(self, variable):
+        """
+            swaps the variable with the last conflicted one, so that it is removed in O(1)
+        """
+        index = self.position[variable]
+        last = self.conflicted.pop()
+        if last != variable:
+            self.conflicted[index] = last
+            self.position[last] = index
+        self.position[variable] = -1
+
+    def set_value(self, variable, value):
+        old_value = self.assignment[variable]
+        for neighbor in self.neighbors[variable]:
+            neighbor_value = self.assignment[neighbor]
+            if neighbor_value is None:
+                continue
+            if neighbor_value == old_value:
+                self.conflicts[neighbor] -= 1
+                self.conflicts[variable] -= 1
+                self.n_conflicts -= 1
+                if self.conflicts[neighbor] == 0:
+                    self.remove_conflicted(neighbor)
+            elif neighbor_value == value:
+                self.conflicts[neighbor] += 1
+                self.conflicts[variable] += 1
+                self.n_conflicts += 1
+                if self.conflicts[neighbor] == 1:
+                    self.add_conflicted(neighbor)
+        self.assignment[variable] = value
+        if self.conflicts[variable] and self.position[variable] == -1:
+            self.add_conflicted(variable)
+        elif not self.conflicts[variable] and self.position[variable] != -1:
+            self.remove_conflicted(variable)
+
+    def restart(self):
+        """
+            gives every variable a random value, and forgets the edge weights and the tabu moves
+        """
+        self.assignment = [None] * self.n_variables
+        self.conflicts = [0] * self.n_variables
+        self.conflicted = []
+        self.position = [-1] * self.n_variables
+        self.n_conflicts = 0
+        self.weights.clear()
+        self.tabu_until.clear()
+        for variable in range(self.n_variables):
+            self.set_value(variable, self.random.choice(self.domains[variable]))
+        self.best_conflicts = self.n_conflicts
+        self.moves_since_best = []
+        if self.on_restart is not None:
+            self.on_restart(self.assignment)
+
+    def get_weight(self, x1, x2):
+        return self.weights.get((x1, x2) if x1 < x2 else (x2, x1), 1)
+
+    def get_value_cost(self, variable, value):
+        """
+            returns the total weight of the edges that would conflict if the variable took the value
+        """
+        cost = 0
+        for neighbor in self.neighbors[variable]:
+            if self.assignment[neighbor] == value:
+                cost += self.get_weight(variable, neighbor)
+        return cost
+
+    def increase_weights(self, variable):
+        value = self.assignment[variable]
+        for neighbor in self.neighbors[variable]:
+            if self.assignment[neighbor] == value:
+                edge = (variable, neighbor) if variable < neighbor else (neighbor, variable)
+                self.weights[edge] = self.weights.get(edge, 1) + 1
+
+    def step(self):
+        """
+            moves a random conflicted variable to its least conflicting other value, ties broken by random
+            the tabu values are only left out when a value that is not tabu is as good as any and does not make the
+            variable worse, so that tabu never forces a worse move and never keeps the search from leaving a plateau
+            with use_breakout, a move that would make the variable worse is not made, its edge weights grow instead
+        """
+        variable = self.random.choice(self.conflicted)
+        current_value = self.assignment[variable]
+        current_cost = self.get_value_cost(variable, current_value)
+        costs = [(value, self.get_value_cost(variable, value)) for value in self.domains[variable]
+                 if value != current_value]
+        best_cost = min((cost for _, cost in costs), default=None)
+        allowed = [(value, cost) for value, cost in costs if self.tabu_until.get((variable, value), 0) <= self.steps]
+        allowed_cost = min((cost for _, cost in allowed), default=None)
+        if allowed_cost is None or allowed_cost > current_cost or allowed_cost > best_cost:
+            allowed = costs
+        best_values = [value for value, cost in allowed if cost == best_cost]
+        if self.use_breakout and (best_cost is None or best_cost >= current_cost):
+            self.increase_weights(variable)
+        if best_cost is None or (self.use_breakout and best_cost > current_cost):
+            return
+        value = self.random.choice(best_values)
+        self.tabu_until[(variable, current_value)] = self.steps + self.tabu_tenure
+        self.set_value(variable, value)
+        if self.moves_since_best is not None:
+            self.moves_since_best.append((variable, current_value))
+            if len(self.moves_since_best) > self.n_variables:
+                self.save_best_assignment()
+        if self.on_change is not None:
+            self.on_change(variable, value)
+
+    def save_best_assignment(self):
+        """
+            undoes the logged moves on a copy of the assignment to get the best assignment of the current restart,
+            keeps it if it has fewer conflicts than the best one so far, and stops logging until the next new best
+        """
+        if self.moves_since_best is None:
+            return
+        if self.least_conflicts is None or self.best_conflicts < self.least_conflicts:
+            assignment = list(self.assignment)
+            for variable, value in reversed(self.moves_since_best):
+                assignment[variable] = value
+            self.best_assignment, self.least_conflicts = assignment, self.best_conflicts
+        self.moves_since_best = None
+
+    def get_best_assignment(self):
+        """
+            returns the assignment with the fewest conflicting edges the search went through, and that number
+        """
+        self.save_best_assignment()
+        return self.best_assignment, self.least_conflicts
+
+    def solve(self, max_steps=None, time_limit=None, should_stop=None):
+        """
+            returns True when a coloring without conflicts was found, with the solution in self.assignment,
+            False when max_steps steps were made or time_limit seconds went by before that,
+            and None when should_stop() returned True
+            the time limit and should_stop are only checked once every STOP_CHECK_INTERVAL steps
+        """
+        start_time = time.perf_counter()
+        self.restart()
+        last_improvement = 0
+        while self.conflicted:
+            if self.steps == max_steps:
+                return False
+            if self.steps % STOP_CHECK_INTERVAL == 0:
+                if time_limit is not None and time.perf_counter() - start_time > time_limit:
+                    return False
+                if should_stop is not None and should_stop():
+                    return None
+            self.step()
+            self.steps += 1
+            if self.n_conflicts < self.best_conflicts:
+                self.best_conflicts = self.n_conflicts
+                self.moves_since_best = []
+                last_improvement = self.steps
+            elif self.restart_steps and self.steps - last_improvement >= self.restart_steps:
+                self.save_best_assignment()
+                self.restart()
+                self.restarts += 1
+                last_improvement = self.steps
+        self.solution_time = time.perf_counter() - start_time
+        return True
@@ -1,5 +1,13 @@
 import cv2
+import time
+import itertools
 import numpy as np
+import tracemalloc
+from collections import deque
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from utils import get_renumbering
 
 NO_COLOR = -1
 NOT_MARKED = -1
@@ -10,12 +18,100 @@ IMPORTANT_COLOR_LOW_THRESHOLD = 35
 MINIMUM_REGION_AREA_RATIO = 0.0005
 MAXIMUM_NEIGHBOR_PIXEL_COLOR_DIFFERENCE = 50
 INF = 10 ** 30
-MAXIMUM_NUMBER_OF_REGIONS = 1000
 DX = [-1, +1, 0, 0]
 DY = [0, 0, -1, +1]
 SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+BORDER_KERNEL = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
 MAXIMUM_IMAGE_WIDTH = 1000
 MAXIMUM_IMAGE_HEIGHT = 1000
+TILE_SIZE = 1024
+MINIMUM_TILE_SIZE = 16
+FILTER_HALO = 2
+FAR_APART = (-1, -1)
+WALK_BATCH_SAMPLES = 2 ** 20
+COARSE_WALK_STRIDE = 8
+
+
+def threshold_background(image):
+    """
+        whitens the pixels that are too dark or too bright in place, and returns the mask of them
+    """
+    intensity = image.astype(np.int32).sum(axis=2)
+    background = (intensity < IMPORTANT_COLOR_LOW_THRESHOLD * 3) | (intensity > IMPORTANT_COLOR_HIGH_THRESHOLD * 3)
+    image[background] = (255, 255, 255)
+    return background
+
+
+def filter_tile(tile):
+    """
+        returns a copy of the tile filtered as filter_image() filters the whole image, and the mask of its background
+        only the pixels at least FILTER_HALO pixels away from the edges of the tile that are not edges of the image
+        are the same as on the whole image
+    """
+    tile = tile.copy()
+    background = threshold_background(tile)
+    tile = cv2.medianBlur(tile, 3)
+    background |= threshold_background(tile)
+    tile = cv2.filter2D(tile, -1, SHARPEN_KERNEL)
+    background |= threshold_background(tile)
+    return tile, background
+
+
+def similar_colors(pixels1, pixels2):
+    """
+        the vectorized form of Map.same_pixel_colors() for two arrays of pixels
+    """
+    difference = np.abs(pixels1.astype(np.int32) - pixels2.astype(np.int32)).sum(axis=-1)
+    return difference <= 3 * MAXIMUM_NEIGHBOR_PIXEL_COLOR_DIFFERENCE
+
+
+def label_similar_pixels(image, unmarked):
+    """
+        returns the number of connected components of the unmarked pixels, where two neighbor pixels are connected
+        when their colors are similar, and an array with the component of each unmarked pixel and -1 elsewhere
+    """
+    height, width = unmarked.shape
+    pixel_index = np.arange(height * width).reshape(height, width)
+    same_right = unmarked[:, :-1] & unmarked[:, 1:] & similar_colors(image[:, :-1], image[:, 1:])
+    same_down = unmarked[:-1] & unmarked[1:] & similar_colors(image[:-1], image[1:])
+    sources = np.concatenate((pixel_index[:, :-1][same_right], pixel_index[:-1][same_down]))
+    targets = np.concatenate((pixel_index[:, 1:][same_right], pixel_index[1:][same_down]))
+    pixel_graph = csr_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)),
+                             shape=(height * width, height * width))
+    n_components, components = connected_components(pixel_graph, directed=False)
+    components = components.reshape(height, width)
+    used = np.zeros(n_components, dtype=bool)
+    used[components[unmarked]] = True
+    compact_label = np.cumsum(used) - 1
+    labels = np.full((height, width), NOT_MARKED, dtype=np.int32)
+    labels[unmarked] = compact_label[components[unmarked]]
+    return int(used.sum()), labels
+
+
+def merge_labels(n_labels, sources, targets):
+    """
+        returns the merged label of each label after joining the given pairs of labels
+    """
+    label_graph = csr_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)), shape=(n_labels, n_labels))
+    return connected_components(label_graph, directed=False)
+
+
+class Region:
+    """
+        the pixels of a region, stored as its bounding box corner and a boolean mask over the box
+    """
+    def __init__(self, x, y, mask):
+        self.x = x
+        self.y = y
+        self.mask = mask
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def get_pixels(self):
+        ys, xs = np.nonzero(self.mask)
+        return xs + self.x, ys + self.y
+
 
 class Node:
     def __init__(self, node_id, node_x, node_y):
@@ -32,19 +128,41 @@ class Node:
         self.color = cl
 
 class Map:
-    def __init__(self, image):
+    def __init__(self, image, vectorized=False, use_connected_components=False, use_spatial_index=False,
+                 tiled=False, tile_size=TILE_SIZE):
+        """
+            tiled=True preprocesses the image tile by tile, which lifts the limit on the image size, and implies
+            the vectorized, connected-components and spatial-index modes
+        """
         self.image = image
+        self.tiled = tiled
+        self.tile_size = max(tile_size, MINIMUM_TILE_SIZE)
+        self.vectorized = vectorized or tiled
+        self.use_connected_components = use_connected_components or tiled
+        self.use_spatial_index = use_spatial_index or tiled
         self.height = len(image)
         self.width = len(image[0])
-        if self.width > MAXIMUM_IMAGE_WIDTH or self.height > MAXIMUM_IMAGE_HEIGHT:
+        if not tiled and (self.width > MAXIMUM_IMAGE_WIDTH or self.height > MAXIMUM_IMAGE_HEIGHT):
             print("Error: please specify an image with smaller dimensions.")
             exit(0)
         self.total_area = self.width * self.height
-        self.mark = [[NOT_MARKED for i in range(self.width)] for j in range(self.height)]
+        if self.vectorized:
+            self.mark = np.full((self.height, self.width), NOT_MARKED, dtype=np.int32)
+        else:
+            self.mark = [[NOT_MARKED for i in range(self.width)] for j in range(self.height)]
         self.nodes = []
-        self.regions = [[] for i in range(MAXIMUM_NUMBER_OF_REGIONS)]
-        self.regions_border = [[] for i in range(MAXIMUM_NUMBER_OF_REGIONS)]
-        self.nodes_color = [NO_COLOR for i in range(MAXIMUM_NUMBER_OF_REGIONS)]
+        self.peak_memory = None
+        self.stage_times = {}
+        # one row (i, j, start_x, start_y, end_x, end_y, distance_sqr, blocker_x, blocker_y) for each pair of nodes
+        # that add_graph_edges_spatial() walked the line between the closest border pixels of, where the blocker
+        # is a region pixel on the line, or -1 when the line is free
+        self.border_segments = None
+        # incremented whenever the regions or the mark change after the preprocessing, so that what was built from
+        # them, like the RegionPainter of a Solver, knows it has to be built again
+        self.version = 0
+        self.regions = []
+        self.regions_border = []
+        self.nodes_color = []
     
     def is_inside(self, x, y):
         if x < 0 or x >= self.width or y < 0 or y >= self.height:
@@ -75,10 +193,10 @@ class Map:
         if not self.is_inside(start_x, start_y) or self.mark[start_y][start_x] != src_mark:
             return 0
         color_area = 0
-        queue = [(start_x, start_y)]
+        queue = deque([(start_x, start_y)])
         self.mark[start_y][start_x] = dst_mark
         while queue:
-            x, y = queue.pop(0)
+            x, y = queue.popleft()
             self.mark[y][x] = dst_mark
             color_area += 1
             for k in range(4):
@@ -100,12 +218,22 @@ class Map:
                 if r + g + b > IMPORTANT_COLOR_HIGH_THRESHOLD * 3:
                     self.image[y][x] = (255, 255, 255)
                     self.mark[y][x] = BACKGROUND_MARK
+
+    def apply_threshold_vectorized(self):
+        self.mark[threshold_background(self.image)] = BACKGROUND_MARK
                     
     def whiten_background(self):
         for y in range(self.height):
             for x in range(self.width):
                 if self.mark[y][x] == NOT_MARKED or self.mark[y][x] == BACKGROUND_MARK:
                     self.image[y][x] = (255, 255, 255)
+
+    def whiten_background_vectorized(self):
+        self.image[self.mark < 0] = (255, 255, 255)
+
+    def whiten_background_tiled(self):
+        for y0, y1, x0, x1 in self.get_tiles():
+            self.image[y0:y1, x0:x1][self.mark[y0:y1, x0:x1] < 0] = (255, 255, 255)
     
     def are_adjacent(self, node1: Node, node2: Node):
         start_x, start_y = node1.x, node1.y
@@ -132,53 +260,750 @@ class Map:
             if self.mark[y][x] >= 0 and (x != start_x or y != start_y) and (x != end_x or y != end_y):
                 return False
         return True
-    
+
+    def are_closest_borders_adjacent(self, mark, start, end, distance_sqr):
+        """
+            the second half of are_adjacent(), for the closest pair of border pixels start and end
+            mark has to be an array here, the line between the two pixels is walked in one vectorized step
+        """
+        return self.get_closest_borders_blocker(mark, start, end, distance_sqr) is None
+
+    def get_closest_borders_blocker(self, mark, start, end, distance_sqr):
+        """
+            returns None when are_closest_borders_adjacent() holds, and otherwise a region pixel on the line
+            between start and end, see get_line_blockers(), or FAR_APART when they are too far apart for the line
+            to be walked
+        """
+        (start_x, start_y), (end_x, end_y) = start, end
+        if abs(end_x - start_x) + abs(end_y - start_y) <= 1:
+            return None
+        border_width_threshold = MINIMUM_BORDER_WIDTH_RATIO * (self.width * self.width + self.height * self.height)
+        if distance_sqr >= border_width_threshold:
+            return FAR_APART
+        blocker_x, blocker_y = self.get_line_blockers(mark, np.array([start]), np.array([end]))[0].tolist()
+        return None if blocker_x < 0 else (blocker_x, blocker_y)
+
+    def get_line_blockers(self, mark, starts, ends):
+        """
+            walks the lines between the pixels of starts and ends, (n, 2) arrays, with the steps of are_adjacent(),
+            in batches of about WALK_BATCH_SAMPLES steps
+            every COARSE_WALK_STRIDE-th step is looked at first, and only the lines where none of them is blocked
+            are walked step by step, since most lines cross a region
+            returns an (n, 2) array with a region pixel of each line other than its ends, or (-1, -1) if it has none
+        """
+        total_steps = int(2 * ((self.width * self.width + self.height * self.height) ** 0.5))
+        blockers = np.full((len(starts), 2), -1, dtype=np.int64)
+        batch_size = max(1, WALK_BATCH_SAMPLES // total_steps)
+        for first in range(0, len(starts), batch_size):
+            lines = np.arange(first, min(first + batch_size, len(starts)))
+            for steps in (np.arange(0, total_steps, COARSE_WALK_STRIDE), np.arange(total_steps)):
+                (start_xs, start_ys), (end_xs, end_ys) = starts[lines, :, None].transpose(1, 0, 2), \
+                    ends[lines, :, None].transpose(1, 0, 2)
+                xs = (start_xs + steps * (end_xs - start_xs).astype(np.float64) / total_steps + 0.5).astype(np.int64)
+                ys = (start_ys + steps * (end_ys - start_ys).astype(np.float64) / total_steps + 0.5).astype(np.int64)
+                blocked = (mark[ys, xs] >= 0) & ((xs != start_xs) | (ys != start_ys)) & \
+                    ((xs != end_xs) | (ys != end_ys))
+                is_blocked = blocked.any(axis=1)
+                rows = np.flatnonzero(is_blocked)
+                first_blocked = np.argmax(blocked[rows], axis=1)
+                blockers[lines[rows]] = np.stack((xs[rows, first_blocked], ys[rows, first_blocked]), axis=1)
+                lines = lines[~is_blocked]
+        return blockers
+
+    def get_closest_border_pixels(self, border, tree, partner_borders, search_radius):
+        """
+            finds the closest pixels of border, the border pixels of a node with the KD-tree tree, and of each of
+            partner_borders, with all the partners looked up in tree at once
+            the distance of a partner pixel to the box of border bounds its distance to border from below, so only
+            the pixels whose bound is within the distance of the partner pixel nearest to the box are looked up
+            returns the arrays of the starts, the ends and the squared distances of the partners, where the start is
+            the first pixel of border and the end the first pixel of the partner that are that close, and where the
+            distance is INF when no pixel of the partner is within search_radius
+        """
+        sizes = np.array([len(partner_border) for partner_border in partner_borders])
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        points = np.concatenate(partner_borders)
+        owners = np.repeat(np.arange(len(partner_borders)), sizes)
+        box_gaps = np.maximum(0, np.maximum(border.min(axis=0) - points, points - border.max(axis=0)))
+        bounds_sqr = (box_gaps * box_gaps).sum(axis=1)
+        lowest_bounds_sqr = np.minimum.reduceat(bounds_sqr, offsets[:-1])
+        nearest = np.flatnonzero(bounds_sqr == lowest_bounds_sqr[owners])
+        nearest = nearest[np.searchsorted(nearest, offsets[:-1])]
+        nearest_distances, _ = tree.query(points[nearest])
+        nearest_distances[lowest_bounds_sqr > search_radius * search_radius] = -1
+        near = np.flatnonzero(bounds_sqr <= nearest_distances[owners] ** 2 + 0.5)
+        distances, _ = tree.query(points[near], distance_upper_bound=search_radius)
+        distances_sqr = np.rint(np.where(np.isinf(distances), INF, distances ** 2))
+        closest_sqr = np.full(len(partner_borders), float(INF))
+        np.minimum.at(closest_sqr, owners[near], distances_sqr)
+        # the pixels of the partners at their closest distance, and the pixels of border at that distance of them,
+        # which are all the pixels of border that close to the partners
+        ties = near[(distances_sqr == closest_sqr[owners[near]]) & (distances_sqr < INF)]
+        tie_owners, tie_points = owners[ties], points[ties]
+        ties_sqr = closest_sqr[tie_owners]
+        tie_starts = tree.query_ball_point(tie_points, ties_sqr ** 0.5 + 0.5)
+        starts = np.fromiter(itertools.chain.from_iterable(tie_starts), dtype=np.int64)
+        start_ties = np.repeat(np.arange(len(ties)), [len(tie_start) for tie_start in tie_starts])
+        is_start = ((border[starts] - tie_points[start_ties]) ** 2).sum(axis=1) == ties_sqr[start_ties]
+        first_starts = np.full(len(partner_borders), len(border) - 1)
+        np.minimum.at(first_starts, tie_owners[start_ties[is_start]], starts[is_start])
+        starts = border[first_starts]
+        is_end = ((tie_points - starts[tie_owners]) ** 2).sum(axis=1) == ties_sqr
+        first_ends = np.full(len(partner_borders), len(points) - 1)
+        np.minimum.at(first_ends, tie_owners[is_end], ties[is_end])
+        return starts, points[first_ends], closest_sqr
+
     def change_region_color(self, node: Node, pixel_color):
         region_idx = self.mark[node.y][node.x]
+        if isinstance(self.regions[region_idx], Region):
+            region = self.regions[region_idx]
+            height, width = region.mask.shape
+            self.image[region.y:region.y + height, region.x:region.x + width][region.mask] = pixel_color
+            return
         for i in range(len(self.regions[region_idx])):
             x = self.regions[region_idx][i][0]
             y = self.regions[region_idx][i][1]
             self.image[y][x] = pixel_color
             
     def get_all_regions_pixels(self):
+        for node in self.nodes:
+            self.regions.append([])
+            self.regions_border.append([])
+            self.nodes_color.append(NO_COLOR)
         for y in range(self.height):
             for x in range(self.width):
                 region_mark = self.mark[y][x]
+                if region_mark < 0:
+                    continue
                 self.regions[region_mark].append((x, y))
                 if self.is_on_border(x, y):
                     self.regions_border[region_mark].append((x, y))
 
+    def get_border_mask(self):
+        background = (self.mark == BACKGROUND_MARK).astype(np.uint8)
+        near_background = cv2.dilate(background, BORDER_KERNEL).astype(bool)
+        return near_background & (self.mark != BACKGROUND_MARK)
+
+    def group_pixels_by_region(self, pixel_mask):
+        """
+            returns one list of (x, y) pixels per node, in the same row-major order as the pixel loops
+        """
+        ys, xs = np.nonzero(pixel_mask & (self.mark >= 0))
+        labels = self.mark[ys, xs]
+        order = np.argsort(labels, kind='stable')
+        xs, ys = xs[order].tolist(), ys[order].tolist()
+        ends = np.cumsum(np.bincount(labels, minlength=len(self.nodes))).tolist()
+        groups = []
+        start = 0
+        for end in ends:
+            groups.append(list(zip(xs[start:end], ys[start:end])))
+            start = end
+        return groups
+
+    def get_all_regions_pixels_vectorized(self):
+        self.regions.extend(self.group_pixels_by_region(self.mark >= 0))
+        self.regions_border.extend(self.group_pixels_by_region(self.get_border_mask()))
+        self.nodes_color.extend(NO_COLOR for node in self.nodes)
+
+    def label_regions(self):
+        """
+            labels all the regions at once as the connected components of the unmarked pixels, where two
+            neighbor pixels are connected when same_pixel_colors() holds for them
+            the regions larger than MINIMUM_REGION_AREA_RATIO become nodes in the order of their first pixel,
+            the same order in which the flood fill of find_graph_nodes() discovers them
+        """
+        mark = np.asarray(self.mark, dtype=np.int32)
+        unmarked = mark == NOT_MARKED
+        n_components, labels = label_similar_pixels(self.image, unmarked)
+        components = labels[unmarked]
+        areas = np.bincount(components, minlength=n_components)
+        first_pixel = np.full(n_components, self.total_area)
+        np.minimum.at(first_pixel, components, np.flatnonzero(unmarked))
+        mark[unmarked] = self.get_region_marks(areas, first_pixel)[components]
+        self.mark = mark if self.vectorized else mark.tolist()
+
+    def get_region_marks(self, areas, first_pixel):
+        """
+            creates a node for each label larger than MINIMUM_REGION_AREA_RATIO, in the order of their first pixel,
+            and returns the mark of each label (NOT_MARKED for the dropped ones)
+        """
+        kept = np.flatnonzero(areas > MINIMUM_REGION_AREA_RATIO * self.total_area)
+        kept = kept[np.argsort(first_pixel[kept])]
+        region_marks = np.full(len(areas), NOT_MARKED, dtype=np.int32)
+        region_marks[kept] = np.arange(len(self.nodes), len(self.nodes) + len(kept))
+        for pixel in first_pixel[kept].tolist():
+            self.nodes.append(Node(len(self.nodes), pixel % self.width, pixel // self.width))
+        return region_marks
+
+    def get_tiles(self):
+        for y0 in range(0, self.height, self.tile_size):
+            for x0 in range(0, self.width, self.tile_size):
+                yield y0, min(y0 + self.tile_size, self.height), x0, min(x0 + self.tile_size, self.width)
+
+    def filter_image_tiled(self):
+        """
+            filter_image() tile by tile, each tile is filtered with a halo of FILTER_HALO pixels around it
+            so that the median blur and the sharpening give the same pixels as on the whole image
+            only one band of tiles is copied at a time, plus the unfiltered rows above it that the next band needs
+        """
+        rows_above = self.image[:0].copy()
+        for band_y0 in range(0, self.height, self.tile_size):
+            band_y1 = min(band_y0 + self.tile_size, self.height)
+            band = np.concatenate((rows_above, self.image[band_y0:min(band_y1 + FILTER_HALO, self.height)]))
+            top = band_y0 - len(rows_above)
+            rows_above = band[max(band_y1 - FILTER_HALO, 0) - top:band_y1 - top].copy()
+            for x0 in range(0, self.width, self.tile_size):
+                x1 = min(x0 + self.tile_size, self.width)
+                left = max(x0 - FILTER_HALO, 0)
+                tile, background = filter_tile(band[:, left:min(x1 + FILTER_HALO, self.width)])
+                inside = (slice(band_y0 - top, band_y1 - top), slice(x0 - left, x1 - left))
+                self.image[band_y0:band_y1, x0:x1] = tile[inside]
+                self.mark[band_y0:band_y1, x0:x1][background[inside]] = BACKGROUND_MARK
+
+    def label_regions_tiled(self):
+        """
+            label_regions() tile by tile: every tile is labelled on its own, then the labels of similar neighbor
+            pixels on the two sides of each tile seam are merged
+        """
+        n_labels = 0
+        areas, first_pixels = [], []
+        for y0, y1, x0, x1 in self.get_tiles():
+            mark = self.mark[y0:y1, x0:x1]
+            unmarked = mark == NOT_MARKED
+            n_tile_labels, labels = label_similar_pixels(self.image[y0:y1, x0:x1], unmarked)
+            ys, xs = np.nonzero(unmarked)
+            components = labels[ys, xs]
+            areas.append(np.bincount(components, minlength=n_tile_labels))
+            first_pixel = np.full(n_tile_labels, self.total_area, dtype=np.int64)
+            np.minimum.at(first_pixel, components, (ys + y0).astype(np.int64) * self.width + xs + x0)
+            first_pixels.append(first_pixel)
+            mark[unmarked] = components + n_labels
+            n_labels += n_tile_labels
+
+        sources, targets = [], []
+        seams = [(self.mark[:, x - 1], self.mark[:, x], self.image[:, x - 1], self.image[:, x])
+                 for x in range(self.tile_size, self.width, self.tile_size)]
+        seams += [(self.mark[y - 1], self.mark[y], self.image[y - 1], self.image[y])
+                  for y in range(self.tile_size, self.height, self.tile_size)]
+        for mark1, mark2, pixels1, pixels2 in seams:
+            connected = (mark1 >= 0) & (mark2 >= 0) & similar_colors(pixels1, pixels2)
+            sources.append(mark1[connected])
+            targets.append(mark2[connected])
+        n_merged, merged = merge_labels(n_labels, np.concatenate(sources or [[]]).astype(np.int64),
+                                        np.concatenate(targets or [[]]).astype(np.int64))
+
+        merged_areas = np.bincount(merged, weights=np.concatenate(areas or [[]]), minlength=n_merged)
+        merged_first_pixel = np.full(n_merged, self.total_area, dtype=np.int64)
+        np.minimum.at(merged_first_pixel, merged, np.concatenate(first_pixels or [[]]).astype(np.int64))
+        label_marks = self.get_region_marks(merged_areas, merged_first_pixel)[merged]
+        for y0, y1, x0, x1 in self.get_tiles():
+            mark = self.mark[y0:y1, x0:x1]
+            labelled = mark >= 0
+            mark[labelled] = label_marks[mark[labelled]]
+
+    def get_all_regions_tiled(self):
+        """
+            stores each region as a Region over its bounding box and its border pixels as an array,
+            in place of the lists of (x, y) pixels
+        """
+        n_nodes = len(self.nodes)
+        min_x, min_y = np.full(n_nodes, self.width), np.full(n_nodes, self.height)
+        max_x, max_y = np.full(n_nodes, -1), np.full(n_nodes, -1)
+        for y0, y1, x0, x1 in self.get_tiles():
+            mark = self.mark[y0:y1, x0:x1]
+            ys, xs = np.nonzero(mark >= 0)
+            labels = mark[ys, xs]
+            np.minimum.at(min_x, labels, xs + x0)
+            np.minimum.at(min_y, labels, ys + y0)
+            np.maximum.at(max_x, labels, xs + x0)
+            np.maximum.at(max_y, labels, ys + y0)
+        for node in self.nodes:
+            x0, y0 = max(int(min_x[node.id]) - 1, 0), max(int(min_y[node.id]) - 1, 0)
+            x1, y1 = min(int(max_x[node.id]) + 2, self.width), min(int(max_y[node.id]) + 2, self.height)
+            mark = self.mark[y0:y1, x0:x1]
+            region_mask = mark == node.id
+            near_background = cv2.dilate((mark == BACKGROUND_MARK).astype(np.uint8), BORDER_KERNEL).astype(bool)
+            ys, xs = np.nonzero(region_mask & near_background)
+            self.regions.append(Region(x0, y0, region_mask))
+            self.regions_border.append(np.stack((xs + x0, ys + y0), axis=1).astype(np.int32))
+            self.nodes_color.append(NO_COLOR)
+
     def find_graph_nodes(self):
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.mark[y][x] == NOT_MARKED:
-                    color_area = self.get_region_area(x, y, NOT_MARKED, len(self.nodes))
-                    if color_area > MINIMUM_REGION_AREA_RATIO * self.total_area:
-                        self.nodes.append(Node(len(self.nodes), x, y))
-                    else:
-                        self.get_region_area(x, y, len(self.nodes), NOT_MARKED)
-        self.get_all_regions_pixels()
+        if self.tiled:
+            self.label_regions_tiled()
+            self.get_all_regions_tiled()
+            return
+        if self.use_connected_components:
+            self.label_regions()
+        else:
+            # the flood fill reads and writes the mark one pixel at a time, which is faster on lists than on arrays
+            if self.vectorized:
+                self.mark = self.mark.tolist()
+            for y in range(self.height):
+                for x in range(self.width):
+                    if self.mark[y][x] == NOT_MARKED:
+                        color_area = self.get_region_area(x, y, NOT_MARKED, len(self.nodes))
+                        if color_area > MINIMUM_REGION_AREA_RATIO * self.total_area:
+                            self.nodes.append(Node(len(self.nodes), x, y))
+                        else:
+                            self.get_region_area(x, y, len(self.nodes), NOT_MARKED)
+            if self.vectorized:
+                self.mark = np.array(self.mark, dtype=np.int32)
+        if self.vectorized:
+            self.get_all_regions_pixels_vectorized()
+        else:
+            self.get_all_regions_pixels()
 
     def add_graph_edges(self):
+        mark = self.mark
+        # are_adjacent() reads the mark one pixel at a time, which is faster on lists than on arrays
+        if self.vectorized:
+            self.mark = mark.tolist()
         for i in range(len(self.nodes)):
             for j in range(len(self.nodes)):
                 if j > i and self.are_adjacent(self.nodes[i], self.nodes[j]):
                     self.nodes[i].add_edge(self.nodes[j])
                     self.nodes[j].add_edge(self.nodes[i])
+        self.mark = mark
 
-    def initial_preprocessing(self):
-        print('Please wait for preprocessing...')
+    def add_graph_edges_spatial(self):
+        """
+            finds the same edges as add_graph_edges() with a KD-tree over the border pixels of each region
+            pairs whose bounding boxes are already farther apart than MINIMUM_BORDER_WIDTH_RATIO allows are skipped,
+            and ties between equally close border pixels are broken in the same order as are_adjacent()
+            the closest border pixels of every pair that is near enough are still needed, even when a region lies
+            between them, since the incremental updates walk their line again when an edit may free it
+        """
+        node_ids = range(len(self.nodes))
+        self.border_segments = np.empty((0, 9), dtype=np.int64)
+        for i, j in self.get_adjacent_pairs(self.get_near_pairs(node_ids, node_ids)):
+            self.nodes[i].add_edge(self.nodes[j])
+            self.nodes[j].add_edge(self.nodes[i])
 
-        self.apply_threshold()
+    def get_near_pairs(self, node_ids, partner_ids):
+        """
+            returns the sorted (i, j) pairs of nodes, with i < j, of a node of node_ids and another node of
+            partner_ids, which has to hold node_ids, whose border pixels may be near enough to be adjacent:
+            the bounding boxes of their border pixels are closer than MINIMUM_BORDER_WIDTH_RATIO allows, or one
+            of them has no border pixel, so that only those pairs are given to get_adjacent_pairs()
+            the box of each node of node_ids is compared with the boxes of all the partners at once
+        """
+        border_width_threshold = MINIMUM_BORDER_WIDTH_RATIO * (self.width * self.width + self.height * self.height)
+        partner_ids = np.array(sorted(partner_ids), dtype=np.int64)
+        positions = {node_id: position for position, node_id in enumerate(partner_ids.tolist())}
+        lowest, highest = np.zeros((len(partner_ids), 2)), np.zeros((len(partner_ids), 2))
+        has_border = np.zeros(len(partner_ids), dtype=bool)
+        for position, node_id in enumerate(partner_ids.tolist()):
+            border = np.array(self.regions_border[node_id], dtype=np.int64).reshape(-1, 2)
+            if len(border):
+                lowest[position], highest[position] = border.min(axis=0), border.max(axis=0)
+                has_border[position] = True
+        pairs = set()
+        for node_id in node_ids:
+            position = positions[node_id]
+            gaps = np.maximum(0, np.maximum(lowest - highest[position], lowest[position] - highest))
+            near = ((gaps * gaps).sum(axis=1) < border_width_threshold) | ~has_border | ~has_border[position]
+            near[position] = False
+            pairs.update((min(node_id, j), max(node_id, j)) for j in partner_ids[near].tolist())
+        return sorted(pairs)
+
+    def get_adjacent_pairs(self, pairs):
+        """
+            returns the (i, j) pairs of nodes of the list pairs, with i < j, that are adjacent, see
+            add_graph_edges_spatial() and get_near_pairs()
+            a pair is checked from the node whose first pixel comes first, as in the node order of a full
+            preprocessing, so that the ties are broken in the same way whatever the numbering of the nodes is,
+            and the closest border pixels of the pairs whose line is walked are added to border_segments
+            the border pixels of a node are only turned into an array and a KD-tree when one of its pairs needs them,
+            the closest border pixels of all the pairs of a node are found at once and their lines are walked in
+            batches, see get_closest_border_pixels() and get_line_blockers()
+        """
+        mark = np.asarray(self.mark, dtype=np.int32)
+        border_width_threshold = MINIMUM_BORDER_WIDTH_RATIO * (self.width * self.width + self.height * self.height)
+        search_radius = border_width_threshold ** 0.5 + 1
+        borders, trees, lowest, highest = {}, {}, {}, {}
+        for node_id in {node_id for pair in pairs for node_id in pair}:
+            border = np.array(self.regions_border[node_id], dtype=np.int64).reshape(-1, 2)
+            borders[node_id] = border
+            trees[node_id] = cKDTree(border) if len(border) else None
+            lowest[node_id] = border.min(axis=0) if len(border) else None
+            highest[node_id] = border.max(axis=0) if len(border) else None
+        adjacent = np.zeros(len(pairs), dtype=bool)
+        partners = {}
+        for index, pair in enumerate(pairs):
+            i, j = sorted(pair, key=lambda node_id: (self.nodes[node_id].y, self.nodes[node_id].x))
+            if trees[i] is None or trees[j] is None:
+                adjacent[index] = self.are_adjacent(self.nodes[i], self.nodes[j])
+                continue
+            gap = np.maximum(0, np.maximum(lowest[j] - highest[i], lowest[i] - highest[j]))
+            if gap.dot(gap) < border_width_threshold:
+                partners.setdefault(i, []).append((index, j))
+        segments = [np.empty((0, 10), dtype=np.int64)]
+        for i, node_partners in partners.items():
+            indices, js = np.array(node_partners, dtype=np.int64).T
+            starts, ends, distances_sqr = self.get_closest_border_pixels(borders[i], trees[i],
+                                                                         [borders[j] for j in js.tolist()],
+                                                                         search_radius)
+            kept = (distances_sqr < border_width_threshold) | \
+                ((distances_sqr < INF) & (np.abs(ends - starts).sum(axis=1) <= 1))
+            segments.append(np.column_stack((indices, np.full(len(js), i), js, starts, ends, distances_sqr,
+                                             np.full((len(js), 2), -1)))[kept].astype(np.int64))
+        segments = np.concatenate(segments)
+        segments = segments[np.argsort(segments[:, 0], kind='stable')]
+        walked = np.flatnonzero(np.abs(segments[:, 5:7] - segments[:, 3:5]).sum(axis=1) > 1)
+        segments[walked, 8:] = self.get_line_blockers(mark, segments[walked, 3:5], segments[walked, 5:7])
+        adjacent[segments[segments[:, 8] < 0, 0]] = True
+        if self.border_segments is None:
+            self.border_segments = np.empty((0, 9), dtype=np.int64)
+        self.border_segments = np.concatenate((self.border_segments, segments[:, 1:]))
+        return [(min(pair), max(pair)) for pair, is_adjacent in zip(pairs, adjacent.tolist()) if is_adjacent]
+
+    def filter_image(self):
+        apply_threshold = self.apply_threshold_vectorized if self.vectorized else self.apply_threshold
+        apply_threshold()
         self.image = cv2.medianBlur(self.image, 3)
-        self.apply_threshold()
+        apply_threshold()
         self.image = cv2.filter2D(self.image, -1, SHARPEN_KERNEL)
-        self.apply_threshold()
+        apply_threshold()
+
+    def initial_preprocessing(self):
+        print('Please wait for preprocessing...')
+        if self.tiled:
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        stage_start_time = time.perf_counter()
+        if self.tiled:
+            self.filter_image_tiled()
+        else:
+            self.filter_image()
+        stage_start_time = self.record_stage_time('filter', stage_start_time)
 
         self.find_graph_nodes()
-        self.add_graph_edges()
+        stage_start_time = self.record_stage_time('nodes', stage_start_time)
+        if self.use_spatial_index:
+            self.add_graph_edges_spatial()
+        else:
+            self.add_graph_edges()
+        stage_start_time = self.record_stage_time('edges', stage_start_time)
+
+        if self.tiled:
+            self.whiten_background_tiled()
+        elif self.vectorized:
+            self.whiten_background_vectorized()
+        else:
+            self.whiten_background()
+        self.record_stage_time('background', stage_start_time)
 
-        self.whiten_background()
+        if self.tiled:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if not was_tracing:
+                tracemalloc.stop()
+            print(f'Peak preprocessing memory: {self.peak_memory / 2 ** 20:.1f} MB')
 
         print('Preprocessing finished.')
-    
\ No newline at end of file
+
+    def record_stage_time(self, stage, start_time):
+        """
+            stores the seconds since start_time in stage_times, and returns the current time for the next stage
+        """
+        end_time = time.perf_counter()
+        self.stage_times[stage] = end_time - start_time
+        return end_time
+
+    def load_graph(self, nodes, adjacency, labels, border_segments=None):
+        """
+            restores the state initial_preprocessing() leaves, from the (id, x, y) nodes, the adjacency lists,
+            the label array and the border segments it produced for the same image, instead of preprocessing
+            the image again
+            the map has to be vectorized, labels becomes its mark
+        """
+        start_time = time.perf_counter()
+        self.mark = labels
+        self.border_segments = border_segments
+        for node_id, x, y in nodes:
+            self.nodes.append(Node(node_id, x, y))
+        for node, adj in zip(self.nodes, adjacency):
+            node.adj = list(adj)
+        if self.tiled:
+            self.get_all_regions_tiled()
+            self.whiten_background_tiled()
+        else:
+            self.get_all_regions_pixels_vectorized()
+            self.whiten_background_vectorized()
+        self.record_stage_time('load', start_time)
+
+    def get_region_box(self, node_id):
+        """
+            returns the box (x0, y0, x1, y1) around the pixels of the node, x1 and y1 excluded
+        """
+        region = self.regions[node_id]
+        if isinstance(region, Region):
+            height, width = region.mask.shape
+            return region.x, region.y, region.x + width, region.y + height
+        xs, ys = np.array(region).T
+        return int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1
+
+    def get_update_box(self, x0, y0, x1, y1, node_ids):
+        """
+            returns the box around the pixels of the box and of the nodes, grown until none of its unmarked pixels
+            is connected to an unmarked pixel outside, unless through the box
+        """
+        for node_id in node_ids:
+            box_x0, box_y0, box_x1, box_y1 = self.get_region_box(node_id)
+            x0, y0, x1, y1 = min(x0, box_x0), min(y0, box_y0), max(x1, box_x1), max(y1, box_y1)
+        inner_x0, inner_y0, inner_x1, inner_y1 = x0, y0, x1, y1
+        while True:
+            unmarked = (self.mark[y0:y1, x0:x1] == NOT_MARKED).astype(np.uint8)
+            _, components = cv2.connectedComponents(unmarked, connectivity=4)
+            inner = components[inner_y0 - y0:inner_y1 - y0, inner_x0 - x0:inner_x1 - x0]
+            inner = np.unique(inner[inner > 0])
+            sides = [side for side, is_inside in ((components[0], y0 > 0), (components[-1], y1 < self.height),
+                                                  (components[:, 0], x0 > 0), (components[:, -1], x1 < self.width))
+                     if is_inside]
+            if not sides or not np.isin(np.concatenate(sides), inner).any():
+                return x0, y0, x1, y1
+            margin = max(x1 - x0, y1 - y0)
+            x0, y0 = max(x0 - margin, 0), max(y0 - margin, 0)
+            x1, y1 = min(x1 + margin, self.width), min(y1 + margin, self.height)
+
+    def store_regions(self, node_ids, x0, y0, x1, y1):
+        """
+            stores the pixels and the border pixels of the nodes, which have to lie inside the box (x0, y0, x1, y1)
+            with one pixel to spare on each side that is not an edge of the image, as find_graph_nodes() does
+        """
+        mark = self.mark[y0:y1, x0:x1]
+        near_background = cv2.dilate((mark == BACKGROUND_MARK).astype(np.uint8), BORDER_KERNEL).astype(bool)
+        for node_id in node_ids:
+            region_mask = mark == node_id
+            border_ys, border_xs = np.nonzero(region_mask & near_background)
+            if self.tiled:
+                ys, xs = np.nonzero(region_mask)
+                region_x0, region_y0 = max(int(xs.min()) + x0 - 1, 0), max(int(ys.min()) + y0 - 1, 0)
+                region_x1 = min(int(xs.max()) + x0 + 2, self.width)
+                region_y1 = min(int(ys.max()) + y0 + 2, self.height)
+                region = Region(region_x0, region_y0, self.mark[region_y0:region_y1, region_x0:region_x1] == node_id)
+                border = np.stack((border_xs + x0, border_ys + y0), axis=1).astype(np.int32)
+            else:
+                ys, xs = np.nonzero(region_mask)
+                region = list(zip((xs + x0).tolist(), (ys + y0).tolist()))
+                border = list(zip((border_xs + x0).tolist(), (border_ys + y0).tolist()))
+            if node_id < len(self.regions):
+                self.regions[node_id], self.regions_border[node_id] = region, border
+            else:
+                self.regions.append(region)
+                self.regions_border.append(border)
+                self.nodes_color.append(NO_COLOR)
+
+    def walk_border_segments(self, dropped_nodes, old_edges, x0, y0, x1, y1):
+        """
+            drops the border segments of the dropped nodes, and walks again the line of the other segments that
+            may be blocked or freed by the pixels of the box (x0, y0, x1, y1): the free lines that cross the box,
+            and the lines whose blocker is inside it, since a blocker outside the box is still there, all at once with
+            get_line_blockers()
+            the edges of those pairs before and after are added to old_edges and returned, and the adjacency lists
+            are updated
+        """
+        segments = self.border_segments
+        segments = segments[~(np.isin(segments[:, 0], list(dropped_nodes)) |
+                              np.isin(segments[:, 1], list(dropped_nodes)))]
+        xs, ys = segments[:, [2, 4]], segments[:, [3, 5]]
+        crossing = (xs.min(axis=1) < x1) & (xs.max(axis=1) >= x0) & (ys.min(axis=1) < y1) & (ys.max(axis=1) >= y0)
+        blocker_xs, blocker_ys = segments[:, 7], segments[:, 8]
+        blocked_inside = (blocker_xs >= x0) & (blocker_xs < x1) & (blocker_ys >= y0) & (blocker_ys < y1)
+        walked = np.flatnonzero(crossing & ((blocker_xs < 0) | blocked_inside))
+        self.border_segments = segments
+        mark = np.asarray(self.mark, dtype=np.int32)
+        border_width_threshold = MINIMUM_BORDER_WIDTH_RATIO * (self.width * self.width + self.height * self.height)
+        starts, ends, distances_sqr = segments[walked, 2:4], segments[walked, 4:6], segments[walked, 6]
+        touching = np.abs(ends - starts).sum(axis=1) <= 1
+        lines = np.flatnonzero(~touching & (distances_sqr < border_width_threshold))
+        blockers = np.full((len(walked), 2), -1, dtype=np.int64)
+        blockers[lines] = self.get_line_blockers(mark, starts[lines], ends[lines])
+        segments[walked, 7:] = blockers
+        is_adjacent = touching | ((distances_sqr < border_width_threshold) & (blockers[:, 0] < 0))
+        new_edges = set()
+        for (i, j), adjacent in zip(segments[walked, :2].tolist(), is_adjacent.tolist()):
+            was_adjacent = j in self.nodes[i].adj
+            if was_adjacent:
+                old_edges.add((min(i, j), max(i, j)))
+            if adjacent:
+                new_edges.add((min(i, j), max(i, j)))
+            if adjacent and not was_adjacent:
+                self.nodes[i].add_edge(self.nodes[j])
+                self.nodes[j].add_edge(self.nodes[i])
+            elif was_adjacent and not adjacent:
+                self.nodes[i].adj.remove(j)
+                self.nodes[j].adj.remove(i)
+        return new_edges
+
+    def remove_nodes(self, removed):
+        """
+            drops the removed nodes, whose pixels are already marked with something else, and gives their numbers
+            to the last nodes as utils.get_renumbering() does
+        """
+        renumbering = get_renumbering(len(self.nodes), removed)
+        for old_id, new_id in renumbering.items():
+            node = self.nodes[old_id]
+            node.id = new_id
+            self.nodes[new_id] = node
+            region = self.regions[old_id]
+            if isinstance(region, Region):
+                height, width = region.mask.shape
+                self.mark[region.y:region.y + height, region.x:region.x + width][region.mask] = new_id
+            else:
+                xs, ys = np.array(region).T
+                self.mark[ys, xs] = new_id
+            self.regions[new_id], self.regions_border[new_id] = region, self.regions_border[old_id]
+            for neighbor in node.adj:
+                adj = self.nodes[neighbor].adj
+                adj[adj.index(old_id)] = new_id
+        if self.border_segments is not None and renumbering:
+            numbers = np.arange(len(self.nodes))
+            numbers[list(renumbering)] = list(renumbering.values())
+            self.border_segments[:, :2] = numbers[self.border_segments[:, :2]]
+        n_kept = len(self.nodes) - len(removed)
+        del self.regions[n_kept:], self.regions_border[n_kept:], self.nodes_color[n_kept:]
+        del self.nodes[n_kept:]
+        self.version += 1
+
+    def get_nodes_near_box(self, x0, y0, x1, y1):
+        """
+            returns the nodes with a pixel closer to the box (x0, y0, x1, y1) than MINIMUM_BORDER_WIDTH_RATIO allows
+            two regions to be apart, the only ones that can be adjacent to a region inside the box
+        """
+        border_width_threshold = MINIMUM_BORDER_WIDTH_RATIO * (self.width * self.width + self.height * self.height)
+        margin = int(border_width_threshold ** 0.5) + 1
+        near = self.mark[max(y0 - margin, 0):y1 + margin, max(x0 - margin, 0):x1 + margin]
+        return set(np.unique(near[near >= 0]).tolist())
+
+    def update_patch(self, image, x0, y0, x1, y1):
+        """
+            preprocesses again only the part of the map that can change when image, the new unfiltered image of the
+            whole map, differs from the image the map was built from only inside the box [x0, x1) x [y0, y1)
+            the box is widened by what the filter reads around a pixel, and every region with a pixel in it or next
+            to it is labelled again as a whole, so that the regions that are split, merged or redrawn get the same
+            pixels and edges as in a full preprocessing
+            only the pairs of one of those regions with a region that has a pixel within the border width margin of the
+            relabelled box are checked for adjacency, since the closest border pixels of an adjacent pair are closer
+            than that, and the pairs of the other regions whose border segment crosses the box have their line walked
+            again, so that the cost follows the size of the edit rather than the number of regions
+            a relabelled region keeps the number of the old region it overlaps most, the new regions are numbered
+            after the old ones, and the removed regions are dropped with remove_nodes()
+            returns the changes as a diff for incremental.apply_diff(), numbered before the removed nodes are dropped
+            the map has to be vectorized
+        """
+        start_time = time.perf_counter()
+        if not self.mark.flags.writeable:
+            # the label array of a cached map is memory-mapped read-only
+            self.mark = np.array(self.mark)
+        x0, y0 = max(x0 - FILTER_HALO - 1, 0), max(y0 - FILTER_HALO - 1, 0)
+        x1, y1 = min(x1 + FILTER_HALO + 1, self.width), min(y1 + FILTER_HALO + 1, self.height)
+        touched = self.mark[y0:y1, x0:x1]
+        touched = set(np.unique(touched[touched >= 0]).tolist())
+        x0, y0, x1, y1 = self.get_update_box(x0, y0, x1, y1, touched)
+        # the ring of pixels around the box is read to merge the labels of the box with the regions outside
+        ring_x0, ring_y0 = max(x0 - 1, 0), max(y0 - 1, 0)
+        ring_x1, ring_y1 = min(x1 + 1, self.width), min(y1 + 1, self.height)
+        tile_x0, tile_y0 = max(ring_x0 - FILTER_HALO, 0), max(ring_y0 - FILTER_HALO, 0)
+        tile, background = filter_tile(image[tile_y0:min(ring_y1 + FILTER_HALO, self.height),
+                                             tile_x0:min(ring_x1 + FILTER_HALO, self.width)])
+        ring = (slice(ring_y0 - tile_y0, ring_y1 - tile_y0), slice(ring_x0 - tile_x0, ring_x1 - tile_x0))
+        tile, background = tile[ring], background[ring]
+        box = (slice(y0 - ring_y0, y1 - ring_y0), slice(x0 - ring_x0, x1 - ring_x0))
+        unmarked = ~background[box]
+        n_labels, labels = label_similar_pixels(tile[box], unmarked)
+
+        n_nodes = len(self.nodes)
+        old_mark = self.mark[ring_y0:ring_y1, ring_x0:ring_x1].copy()
+        combined = np.where(old_mark >= 0, old_mark + n_labels, NOT_MARKED)
+        combined[box] = labels
+        same_right = (combined[:, :-1] >= 0) & (combined[:, 1:] >= 0) & similar_colors(tile[:, :-1], tile[:, 1:])
+        same_down = (combined[:-1] >= 0) & (combined[1:] >= 0) & similar_colors(tile[:-1], tile[1:])
+        n_merged, merged = merge_labels(n_labels + n_nodes,
+                                        np.concatenate((combined[:, :-1][same_right], combined[:-1][same_down])),
+                                        np.concatenate((combined[:, 1:][same_right], combined[1:][same_down])))
+        combined[box] = NOT_MARKED
+        outside_marks = np.unique(combined[combined >= 0]) - n_labels
+        group_marks = np.full(n_merged, NOT_MARKED, dtype=np.int32)
+        group_marks[merged[outside_marks + n_labels]] = outside_marks
+
+        box_mark = old_mark[box]
+        relabelled = set(np.unique(box_mark[box_mark >= 0]).tolist()) - set(outside_marks.tolist())
+        groups = merged[labels[unmarked]]
+        ys, xs = np.nonzero(unmarked)
+        areas = np.bincount(groups, minlength=n_merged)
+        first_pixel = np.full(n_merged, self.total_area, dtype=np.int64)
+        np.minimum.at(first_pixel, groups, (ys + y0).astype(np.int64) * self.width + xs + x0)
+        kept = np.flatnonzero((group_marks == NOT_MARKED) & (areas > MINIMUM_REGION_AREA_RATIO * self.total_area))
+        kept = kept[np.argsort(first_pixel[kept])]
+
+        # each kept label takes the number of the relabelled region it overlaps most, if no other label took it,
+        # and a region away from the changed pixels that gets all its pixels back is left as it was
+        previous = box_mark[unmarked]
+        overlapping = np.isin(groups, kept) & np.isin(previous, list(relabelled))
+        overlaps, counts = np.unique(groups[overlapping].astype(np.int64) * n_nodes + previous[overlapping],
+                                     return_counts=True)
+        inherited, unchanged = set(), set()
+        order = np.argsort(-counts, kind='stable')
+        for overlap, count in zip(overlaps[order].tolist(), counts[order].tolist()):
+            group, node_id = divmod(overlap, n_nodes)
+            if group_marks[group] == NOT_MARKED and node_id not in inherited:
+                group_marks[group] = node_id
+                inherited.add(node_id)
+                if node_id not in touched and count == areas[group] == len(self.regions[node_id]):
+                    unchanged.add(node_id)
+        relabelled -= unchanged
+        changed, new_nodes = [], []
+        for group in kept.tolist():
+            if group_marks[group] in unchanged:
+                continue
+            if group_marks[group] == NOT_MARKED:
+                group_marks[group] = n_nodes + len(new_nodes)
+                new_nodes.append(int(group_marks[group]))
+            changed.append(int(group_marks[group]))
+        changed_nodes = set(changed)
+
+        box_mark = np.full(unmarked.shape, BACKGROUND_MARK, dtype=np.int32)
+        box_mark[unmarked] = group_marks[groups]
+        self.mark[y0:y1, x0:x1] = box_mark
+        self.image[y0:y1, x0:x1] = tile[box]
+        self.image[y0:y1, x0:x1][box_mark < 0] = (255, 255, 255)
+
+        # without the border segments of a full preprocessing, the edges of every node are found again once
+        reset_nodes = relabelled if self.border_segments is not None else set(range(n_nodes))
+        old_edges = {(min(i, j), max(i, j)) for i in reset_nodes for j in self.nodes[i].adj}
+        for node_id in reset_nodes:
+            for neighbor in self.nodes[node_id].adj:
+                if neighbor not in reset_nodes:
+                    self.nodes[neighbor].adj.remove(node_id)
+            self.nodes[node_id].adj = []
+        self.nodes.extend(None for _ in new_nodes)
+        for group in kept.tolist():
+            node_id = int(group_marks[group])
+            if node_id in unchanged:
+                continue
+            pixel = int(first_pixel[group])
+            self.nodes[node_id] = Node(node_id, pixel % self.width, pixel // self.width)
+        self.store_regions(sorted(changed_nodes), ring_x0, ring_y0, ring_x1, ring_y1)
+        removed = relabelled - inherited
+        live_nodes = [node_id for node_id in range(len(self.nodes)) if node_id not in removed]
+        new_edges = set()
+        if self.border_segments is None:
+            checked_nodes = partner_nodes = set(live_nodes)
+        else:
+            checked_nodes = changed_nodes
+            new_edges = self.walk_border_segments(relabelled | changed_nodes, old_edges, x0, y0, x1, y1)
+            partner_nodes = self.get_nodes_near_box(ring_x0, ring_y0, ring_x1, ring_y1) - removed | changed_nodes
+        for i, j in self.get_adjacent_pairs(self.get_near_pairs(checked_nodes, partner_nodes)):
+            self.nodes[i].add_edge(self.nodes[j])
+            self.nodes[j].add_edge(self.nodes[i])
+            new_edges.add((i, j))
+        diff = {'added_nodes': len(new_nodes), 'removed_nodes': sorted(removed),
+                'removed_edges': sorted(old_edges - new_edges), 'added_edges': sorted(new_edges - old_edges)}
+        self.remove_nodes(removed)
+        self.version += 1
+        self.record_stage_time('update', start_time)
+        return diff
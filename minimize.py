@@ -0,0 +1,87 @@
+import time
+import heapq
+from solver import Solver, SolveResult, SOLVED, NO_SOLUTION
+
+MINIMIZE_CONFIG = {'filtering_mode': '-fc', 'use_variable_ordering': True, 'use_value_ordering': True}
+
+
+def get_dsatur_coloring(graph):
+    """
+        colors the graph greedily in the DSATUR order: the next variable is the one with the most distinct colors
+        among its colored neighbors, ties broken by the most uncolored neighbors, and it gets the lowest color none
+        of its neighbors has
+        returns the assignment and the number of colors it uses
+    """
+    neighbor_colors = {variable: set() for variable in graph}
+    uncolored_degree = {variable: len(graph[variable]) for variable in graph}
+    assignment = {variable: None for variable in graph}
+    heap = [(0, -uncolored_degree[variable], variable) for variable in graph]
+    heapq.heapify(heap)
+    n_colors = 0
+    while heap:
+        saturation, degree, variable = heapq.heappop(heap)
+        if assignment[variable] is not None or (-saturation, -degree) != (len(neighbor_colors[variable]),
+                                                                          uncolored_degree[variable]):
+            continue
+        color = next(color for color in range(len(graph[variable]) + 1) if color not in neighbor_colors[variable])
+        assignment[variable] = color
+        n_colors = max(n_colors, color + 1)
+        for neighbor in graph[variable]:
+            if assignment[neighbor] is None:
+                neighbor_colors[neighbor].add(color)
+                uncolored_degree[neighbor] -= 1
+                heapq.heappush(heap, (-len(neighbor_colors[neighbor]), -uncolored_degree[neighbor], neighbor))
+    return assignment, n_colors
+
+
+def get_clique_lower_bound(graph):
+    """
+        returns the size of a clique found greedily around each variable, which no coloring can use fewer colors than
+        each clique grows from a variable with its neighbors of the highest degree first
+    """
+    largest_clique = 1 if graph else 0
+    for variable in graph:
+        if len(graph[variable]) < largest_clique:
+            continue
+        clique = [variable]
+        for neighbor in sorted(graph[variable], key=lambda neighbor: -len(graph[neighbor])):
+            if all(member in graph[neighbor] for member in clique):
+                clique.append(neighbor)
+        largest_clique = max(largest_clique, len(clique))
+    return largest_clique
+
+
+def minimize_colors(graph, config=None, time_limit=None, node_limit=None):
+    """
+        looks for a coloring of the graph with as few colors as possible within time_limit seconds and node_limit
+        search nodes: the DSATUR coloring gives an upper bound k, then a Solver of config (MINIMIZE_CONFIG by default)
+        looks for a coloring with k - 1 colors, and so on, until a search proves that there is none, the bound meets
+        the clique lower bound, or the budget runs out
+        returns a SolveResult with the coloring with the fewest colors found, always SOLVED since even the DSATUR
+        coloring is valid, whose statistics hold its number of colors, the bounds and whether it is proven optimal
+    """
+    start_time = time.perf_counter()
+    config = dict(MINIMIZE_CONFIG, **(config or {}))
+    assignment, n_colors = get_dsatur_coloring(graph)
+    lower_bound = get_clique_lower_bound(graph)
+    stats = {'upper_bound': n_colors, 'searches': 0, 'expanded_nodes': 0}
+    while n_colors > lower_bound:
+        remaining_time = None if time_limit is None else time_limit - (time.perf_counter() - start_time)
+        remaining_nodes = None if node_limit is None else node_limit - stats['expanded_nodes']
+        if (remaining_time is not None and remaining_time <= 0) or \
+                (remaining_nodes is not None and remaining_nodes <= 0):
+            break
+        config.update(n_colors=n_colors - 1, time_limit=remaining_time, node_limit=remaining_nodes, anytime=False)
+        result = Solver(graph, **config).solve()
+        stats['searches'] += 1
+        stats['expanded_nodes'] += result.stats.get('expanded_nodes', 0)
+        if result.solved:
+            assignment = result.assignment
+            n_colors = len(set(assignment.values()))
+        else:
+            if result.status == NO_SOLUTION:
+                lower_bound = n_colors
+            break
+    stats.update(n_colors=n_colors, lower_bound=lower_bound, optimal=n_colors == lower_bound,
+                 time=time.perf_counter() - start_time)
+    return SolveResult(SOLVED, assignment, stats)
@@ -0,0 +1,90 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from csp import DSATUR
+from solver import Solver, SOLVED
+
+N_RESTARTS = 4
+RESTART_MAX_STEPS = 10000
+PORTFOLIO_CONFIGS = [
+    {'filtering_mode': '-fc', 'use_variable_ordering': True, 'use_value_ordering': True},
+    {'filtering_mode': '-fc', 'use_variable_ordering': True, 'use_value_ordering': True, 'variable_heuristic': DSATUR},
+    {'filtering_mode': '-ac', 'use_variable_ordering': True, 'use_value_ordering': True},
+    {'filtering_mode': '-fc', 'use_variable_ordering': True, 'use_value_ordering': False},
+    {'filtering_mode': '-n', 'use_variable_ordering': True, 'use_value_ordering': True},
+] + [{'filtering_mode': '-ii', 'seed': seed, 'max_steps': RESTART_MAX_STEPS} for seed in range(N_RESTARTS)]
+ERROR = 'error'
+
+STOP_EVENT = None
+
+
+def set_stop_event(stop_event):
+    global STOP_EVENT
+    STOP_EVENT = stop_event
+
+
+def run_configuration(graph, config):
+    """
+        runs in a worker process, until the solver finishes or another worker found a coloring
+    """
+    start_time = time.perf_counter()
+    result = Solver(graph, should_stop=STOP_EVENT.is_set, **config).solve()
+    return result, time.perf_counter() - start_time
+
+
+def describe_config(config):
+    if config['filtering_mode'] == '-ii':
+        return f"-ii seed={config.get('seed')}"
+    flags = ['-t' if config.get(flag, True) else '-f' for flag in ('use_variable_ordering', 'use_value_ordering')]
+    if config.get('variable_heuristic') == DSATUR:
+        flags.append('--dsatur')
+    return ' '.join([config['filtering_mode']] + flags)
+
+
+def is_valid_coloring(graph, assignment):
+    return all(assignment[variable] is not None and assignment[variable] != assignment[neighbor]
+               for variable in graph for neighbor in graph[variable])
+
+
+def solve_portfolio(graph, configs=None, max_workers=None):
+    """
+        runs every Solver config of configs (PORTFOLIO_CONFIGS by default) in a process pool of max_workers
+        workers (one per config, but no more than the CPUs, by default), and stops all the others as soon as one of
+        them returns a valid coloring
+        returns the first SolveResult with a valid coloring (None if no config found one), with the config that
+        found it in its stats, and a report with the status and the wall time of each config
+        a config that raised, or whose worker died, gets an ERROR report with the message of the error, and the
+        other configs go on
+    """
+    configs = PORTFOLIO_CONFIGS if configs is None else configs
+    start_time = time.perf_counter()
+    stop_event = multiprocessing.Event()
+    best_result = None
+    reports = []
+    max_workers = max_workers or min(len(configs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=set_stop_event,
+                             initargs=(stop_event,)) as executor:
+        futures = {executor.submit(run_configuration, graph, config): config for config in configs}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            try:
+                result, elapsed_time = future.result()
+            except Exception as error:
+                reports.append({'config': describe_config(futures[future]), 'status': ERROR,
+                                'time': time.perf_counter() - start_time,
+                                'message': f'{type(error).__name__}: {error}'})
+                continue
+            if best_result is None and result.status == SOLVED and is_valid_coloring(graph, result.assignment):
+                best_result = result
+                best_result.stats['config'] = describe_config(futures[future])
+                stop_event.set()
+                for pending_future in futures:
+                    pending_future.cancel()
+            reports.append({'config': describe_config(futures[future]), 'status': result.status,
+                            'time': elapsed_time})
+    for future, config in futures.items():
+        if future.cancelled():
+            reports.append({'config': describe_config(config), 'status': 'cancelled', 'time': 0.0})
+    return best_result, reports
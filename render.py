@@ -0,0 +1,97 @@
+import os
+import cv2
+import numpy as np
+
+VIDEO_FPS = 30
+VIDEO_CODECS = {'.mp4': 'mp4v', '.avi': 'MJPG'}
+FULL_REPAINT_RATIO = 0.25
+
+
+class FrameRecorder:
+    """
+        samples the colorized map once every `every` updates, and writes the frames to a video file
+        when path ends with one of VIDEO_CODECS, or else as numbered PNG images in the path directory
+    """
+    def __init__(self, path, every=1):
+        self.path = path
+        self.every = max(every, 1)
+        self.n_updates = 0
+        self.n_frames = 0
+        self.video = None
+        self.codec = VIDEO_CODECS.get(os.path.splitext(path)[1].lower())
+        if self.codec is None:
+            os.makedirs(path, exist_ok=True)
+
+    def is_due(self):
+        """
+            counts one update and returns True if a frame should be recorded for it
+        """
+        self.n_updates += 1
+        return self.n_updates % self.every == 0
+
+    def write(self, image):
+        if self.codec is None:
+            cv2.imwrite(os.path.join(self.path, f'frame_{self.n_frames:06d}.png'), image)
+        else:
+            if self.video is None:
+                height, width = image.shape[:2]
+                self.video = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.codec), VIDEO_FPS,
+                                             (width, height))
+            self.video.write(image)
+        self.n_frames += 1
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+
+
+class RegionPainter:
+    """
+        paints the regions of a map image from its label array with one palette lookup, palette[labels], and paints
+        only the pixels of the regions whose color changed when there are few of them
+        the palette holds one color per region, then the color of each pixel outside the regions, which keeps the
+        color it has in the image, and the region pixels are also sorted by region once for the partial frames
+        colors is the list of the BGR colors, the last one is used for the uncolored regions, and the image is
+        painted in place
+        the painter has to be built again when the regions of the map change
+    """
+    def __init__(self, image, mark, n_regions, colors):
+        self.image = np.ascontiguousarray(image)
+        self.n_regions = n_regions
+        self.colors = np.array(colors, dtype=np.uint8)
+        flat_mark = np.asarray(mark).ravel()
+        is_region_pixel = flat_mark >= 0
+        other_pixels = np.flatnonzero(~is_region_pixel)
+        self.labels = flat_mark.astype(np.int32)
+        self.labels[other_pixels] = n_regions + np.arange(len(other_pixels), dtype=np.int32)
+        self.palette = np.zeros((n_regions + len(other_pixels), 3), dtype=np.uint8)
+        self.palette[n_regions:] = self.image.reshape(-1, 3)[other_pixels]
+        pixels = np.flatnonzero(is_region_pixel)
+        region_labels = flat_mark[pixels]
+        order = np.argsort(region_labels, kind='stable')
+        self.pixels = pixels[order]
+        self.starts = np.searchsorted(region_labels[order], np.arange(n_regions + 1))
+        # -2 is no color index, so that the first frame paints every region
+        self.color_indices = np.full(n_regions, -2, dtype=np.int64)
+
+    def paint(self, color_indices):
+        """
+            paints each region with the color of its index in colors, -1 meaning uncolored, and returns the number
+            of regions that changed color
+            when the changed regions cover more than FULL_REPAINT_RATIO of the region pixels, the whole frame is
+            one palette lookup, otherwise only the pixels of the changed regions are written
+        """
+        color_indices = np.asarray(color_indices, dtype=np.int64)
+        changed = np.flatnonzero(color_indices != self.color_indices)
+        if len(changed) == 0:
+            return 0
+        self.color_indices[changed] = color_indices[changed]
+        self.palette[changed] = self.colors[color_indices[changed]]
+        flat_image = self.image.reshape(-1, 3)
+        if (self.starts[changed + 1] - self.starts[changed]).sum() > FULL_REPAINT_RATIO * len(self.pixels):
+            np.take(self.palette, self.labels, axis=0, out=flat_image)
+        else:
+            for region in changed.tolist():
+                flat_image[self.pixels[self.starts[region]:self.starts[region + 1]]] = self.palette[region]
+        return len(changed)
@@ -1,132 +1,421 @@
+import os
 import sys
+import json
+import time
+import cProfile
 import cv2
+import numpy as np
 import random
-from map import Map
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from map import Map, MAXIMUM_IMAGE_WIDTH, MAXIMUM_IMAGE_HEIGHT
+from render import FrameRecorder, RegionPainter
+import csp
+import local_search
+import cache
+import decomposition
 import utils
-import copy
 
 ESCAPE_KEY_CHARACTER = 27
 SLEEP_TIME_IN_MILLISECONDS = 1
 
-GRAPH = {}
-COLORED_STATES = {}
 N_COLORS = 4
 COLORING_COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (0, 255, 255)]
+EXTRA_COLOR_SATURATION = 160
 NONE_COLOR = (0, 0, 0)
-BACKTRACK_COUNT = 0
+MAX_STEPS = 100000
+OPTIONS = ['headless', 'output', 'frames', 'frame-every', 'no-cache', 'ac-algorithm', 'max-steps', 'time-limit',
+           'stats', 'profile', 'decompose', 'workers', 'peel', 'dsatur', 'node-limit', 'anytime', 'minimize']
+SUMMED_STATS = ['backtrack_count', 'dead_ends', 'wipeouts', 'expanded_nodes', 'assignments', 'pruned_values',
+                'revisions', 'support_checks', 'steps', 'restarts']
 
-MAP = None
-FILTERING_MODE = None
-USE_VARIABLE_ORDERING = None
-USE_VALUE_ORDERING = None
+SOLVED = 'solved'
+NO_SOLUTION = 'no solution'
+NOT_SOLVED = 'not solved'
+STOPPED = 'stopped'
 
 
-def colorize_map(manual=False):
-    for i in range(len(MAP.nodes)):
-        if COLORED_STATES[i] is None:
-            MAP.change_region_color(MAP.nodes[i], NONE_COLOR)
+class SolveResult:
+    def __init__(self, status, assignment, stats):
+        self.status = status
+        self.assignment = assignment
+        self.stats = stats
+
+    @property
+    def solved(self):
+        return self.status == SOLVED
+
+
+class Solver:
+    """
+        holds the whole state of one coloring run, so that several solvers can run in the same process
+        graph is a dict mapping each variable to the set of its neighbors, as built by get_graph()
+        image_map is only needed for drawing, and nothing is drawn when headless is True
+        should_stop is polled during the search, and the solver gives up as soon as it returns True
+        ac_algorithm is csp.AC3 or csp.AC2001, and is only used in -ac mode
+        variable_heuristic is csp.MRV or csp.DSATUR, and is only used with use_variable_ordering
+        max_steps, tabu_tenure and use_breakout are only used in -ii mode, and node_limit only in the backtracking
+        modes, while time_limit (in seconds) bounds every search, which is STOPPED (NOT_SOLVED in -ii mode) when its
+        budget runs out
+        with anytime, a search that is not solved still returns a complete assignment, with as few conflicting
+        edges as it could find (counted in the conflicts statistic): the best assignment of the -ii search, or the
+        deepest partial assignment without conflicts of the backtracking search, completed with
+        utils.complete_assignment()
+        with time_helpers, the stats of the backtracking modes include the calls and the seconds spent in the helpers
+        of the search, see csp.ColoringCSP
+        with decomposition, decomposition.COMPONENTS or decomposition.BLOCKS, the graph is split into parts that are
+        solved separately, max_workers of them at once, and their colorings are merged
+        with use_peeling, the variables with fewer than n_colors neighbors are peeled off first, only the remaining
+        core is searched, and the peeled variables are colored back greedily
+        domains, the list of the colors each variable may take, restricts the search to them (all n_colors colors
+        by default), and cannot be combined with decomposition or use_peeling
+    """
+    def __init__(self, graph, filtering_mode='-fc', use_variable_ordering=True, use_value_ordering=True,
+                 n_colors=N_COLORS, max_steps=MAX_STEPS, seed=None, image_map=None, headless=True,
+                 frame_recorder=None, should_stop=None, ac_algorithm=csp.AC3, time_limit=None,
+                 tabu_tenure=local_search.TABU_TENURE, use_breakout=True, time_helpers=False,
+                 decomposition=None, max_workers=1, use_peeling=False, variable_heuristic=csp.MRV, domains=None,
+                 node_limit=None, anytime=False):
+        self.graph = graph
+        self.colored_states = {variable: None for variable in graph}
+        self.filtering_mode = filtering_mode
+        self.use_variable_ordering = use_variable_ordering
+        self.use_value_ordering = use_value_ordering
+        self.n_colors = n_colors
+        self.max_steps = max_steps
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.anytime = anytime
+        self.tabu_tenure = tabu_tenure
+        self.use_breakout = use_breakout
+        self.time_helpers = time_helpers
+        self.decomposition = decomposition
+        self.max_workers = max_workers
+        self.use_peeling = use_peeling
+        self.variable_heuristic = variable_heuristic
+        self.domains = domains
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.map = image_map
+        self.headless = headless or image_map is None
+        self.frame_recorder = frame_recorder
+        self.should_stop = should_stop
+        self.ac_algorithm = ac_algorithm
+        self.backtrack_count = 0
+        self.search_stats = {}
+        self.best_assignment = None
+        self.painter = None
+        self.painter_version = None
+
+    def paint_map(self):
+        """
+            paints the regions of the map image with their colors, only the regions whose color changed since the
+            last call are written
+            the painter is built again when the regions of the map changed since, as Map.version tells
+        """
+        n_colors = max(self.n_colors, len(COLORING_COLORS))
+        if self.painter is None or self.painter_version != self.map.version or \
+                len(self.painter.colors) != n_colors + 1:
+            self.painter = RegionPainter(self.map.image, self.map.mark, len(self.map.nodes),
+                                         get_coloring_colors(n_colors) + [NONE_COLOR])
+            self.painter_version = self.map.version
+            self.map.image = self.painter.image
+        self.painter.paint([-1 if self.colored_states[i] is None else self.colored_states[i]
+                            for i in range(len(self.map.nodes))])
+
+    def colorize_map(self, manual=False):
+        """
+            in headless mode nothing is drawn, except the frames sampled by the frame recorder
+        """
+        if self.frame_recorder is not None and self.frame_recorder.is_due():
+            self.paint_map()
+            self.frame_recorder.write(self.map.image)
+        if self.headless:
+            return
+        self.paint_map()
+        cv2.imshow('Colorized Map', self.map.image)
+        if not manual:
+            key = cv2.waitKey(SLEEP_TIME_IN_MILLISECONDS)
         else:
-            MAP.change_region_color(MAP.nodes[i], COLORING_COLORS[COLORED_STATES[i]])
-    cv2.imshow('Colorized Map', MAP.image)
-    if not manual:
-        key = cv2.waitKey(SLEEP_TIME_IN_MILLISECONDS)
-    else:
-        key = cv2.waitKey()
-    if key == ESCAPE_KEY_CHARACTER:
-        cv2.destroyAllWindows()
-        exit()
+            key = cv2.waitKey()
+        if key == ESCAPE_KEY_CHARACTER:
+            cv2.destroyAllWindows()
+            exit()
+
+    def show_solution(self, output_path=None):
+        """
+            renders the final coloring once, writes it to output_path if given, and waits for a key unless headless
+        """
+        if self.frame_recorder is not None:
+            self.paint_map()
+            self.frame_recorder.write(self.map.image)
+            self.frame_recorder.close()
+        if output_path is not None:
+            self.paint_map()
+            cv2.imwrite(output_path, self.map.image)
+        if not self.headless:
+            self.colorize_map(True)
+
+    def update_colored_state(self, variable, value):
+        self.colored_states[variable] = value
+        self.colorize_map()
+
+    def update_colored_states(self, assignment):
+        self.colored_states.update(enumerate(assignment))
+        self.colorize_map()
+
+    '''BACKTRACKING CSP SOLVER'''
 
+    def backtrack_solve(self, domains):
+        """
+            solves the CSP with the bitmask search core in csp.py, and updates colored_states and the displayed map
+            after each assignment
+            returns True when the CSP is solved, False when it has no solution and None when it was stopped
+            or ran out of node_limit nodes or time_limit seconds
+            with anytime, a search that is not solved leaves its deepest partial assignment, completed, in
+            best_assignment
+        """
+        should_stop = self.should_stop
+        if self.time_limit is not None:
+            deadline = time.perf_counter() + self.time_limit
 
-'''BACKTRACKING CSP SOLVER'''
+            def should_stop():
+                return time.perf_counter() > deadline or (self.should_stop is not None and self.should_stop())
+        search = csp.ColoringCSP(self.graph, self.n_colors, domains, self.filtering_mode,
+                                 self.use_variable_ordering, self.use_value_ordering,
+                                 on_change=self.update_colored_state, node_limit=self.node_limit,
+                                 should_stop=should_stop,
+                                 ac_algorithm=self.ac_algorithm, time_helpers=self.time_helpers,
+                                 variable_heuristic=self.variable_heuristic)
+        solved = search.solve()
+        self.backtrack_count += search.backtrack_count
+        self.search_stats = search.get_stats()
+        if self.anytime and not solved:
+            self.best_assignment = search.get_deepest_assignment()
+            utils.complete_assignment(self.graph, self.best_assignment, domains)
+        return solved
 
+    '''ITERATIVE IMPROVEMENT SOLVER'''
 
-def backtrack_solve(domains):
+    def iterative_improvement_solve(self, domains):
+        """
+            initializes all the variables randomly, then changes the conflicting values with the min-conflicts
+            search in local_search.py until solved, or until max_steps steps were made or time_limit seconds went by
+            returns True when the CSP is solved, False when the budget ran out, None when it was stopped,
+            and the search statistics
+        """
+        search = local_search.MinConflicts(self.graph, domains, self.random, self.tabu_tenure, self.use_breakout,
+                                           on_change=self.update_colored_state,
+                                           on_restart=self.update_colored_states)
+        start_time = time.perf_counter()
+        solved = search.solve(self.max_steps, self.time_limit, self.should_stop)
+        elapsed_time = time.perf_counter() - start_time
+        self.best_assignment = search.get_best_assignment()[0]
+        stats = {'steps': search.steps, 'restarts': search.restarts,
+                 'steps_per_second': search.steps / elapsed_time if elapsed_time else 0.0,
+                 'solution_time': search.solution_time}
+        return solved, stats
+
+    '''DECOMPOSITION'''
+
+    def get_config(self):
+        """
+            returns the options this solver searches with, as a config for solve()
+        """
+        return {'filtering_mode': self.filtering_mode, 'use_variable_ordering': self.use_variable_ordering,
+                'use_value_ordering': self.use_value_ordering, 'n_colors': self.n_colors,
+                'max_steps': self.max_steps, 'seed': self.seed, 'ac_algorithm': self.ac_algorithm,
+                'time_limit': self.time_limit, 'tabu_tenure': self.tabu_tenure, 'use_breakout': self.use_breakout,
+                'time_helpers': self.time_helpers, 'variable_heuristic': self.variable_heuristic,
+                'node_limit': self.node_limit, 'anytime': self.anytime}
+
+    def decomposed_solve(self):
+        """
+            solves each part of the graph with a headless Solver of the same options, and merges their colorings
+            into colored_states, so the search only grows with the size of the largest part
+            the parts are solved one after the other until one of them fails when max_workers is 1, sharing the
+            node and time budgets, and in a process pool otherwise, where should_stop is not available and each
+            part gets the whole budgets
+            with anytime, every part is solved, and the assignments of the parts that were not solved are merged too
+            returns the status of the first part that was not solved, or SOLVED, and the statistics summed over
+            the parts
+        """
+        parts = decomposition.get_parts(self.graph, self.decomposition)
+        subgraphs = [decomposition.get_subgraph(self.graph, part) for part in parts]
+        config = self.get_config()
+        if self.max_workers == 1 or len(parts) <= 1:
+            results = []
+            start_time = time.perf_counter()
+            for subgraph in subgraphs:
+                if self.time_limit is not None:
+                    config['time_limit'] = max(self.time_limit - (time.perf_counter() - start_time), 0)
+                if self.node_limit is not None:
+                    config['node_limit'] = max(self.node_limit - sum(result.stats.get('expanded_nodes', 0)
+                                                                     for result in results), 0)
+                results.append(Solver(subgraph, should_stop=self.should_stop, **config).solve())
+                if not results[-1].solved and not self.anytime:
+                    break
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(solve, subgraphs, itertools.repeat(config)))
+        stats = {'parts': len(parts), 'largest_part': max((len(part) for part in parts), default=0), 'max_depth': 0}
+        stats.update((name, 0) for name in SUMMED_STATS)
+        for result in results:
+            for name in SUMMED_STATS:
+                stats[name] += result.stats.get(name, 0)
+            stats['max_depth'] = max(stats['max_depth'], result.stats.get('max_depth', 0))
+        if self.filtering_mode == '-ii':
+            search_time = sum(result.stats['time'] for result in results)
+            stats['steps_per_second'] = stats['steps'] / search_time if search_time else 0.0
+            stats['solution_time'] = search_time
+        failed_result = next((result for result in results if not result.solved), None)
+        if failed_result is not None and not self.anytime:
+            return failed_result.status, stats
+        assignment = decomposition.merge_block_colorings(
+            parts, [[result.assignment[i] for i in range(len(part))] for part, result in zip(parts, results)])
+        self.colored_states.update(assignment)
+        self.colorize_map()
+        return SOLVED if failed_result is None else failed_result.status, stats
+
+    def peeled_solve(self):
+        """
+            peels off the variables with fewer than n_colors neighbors until none is left, solves the remaining core
+            with a headless Solver of the same options (decomposition included), then colors the peeled variables
+            in the reverse order of their removal, which adds no conflict even when the core has some with anytime
+            returns the status of the core and its statistics, with the sizes of the core and of the peeled part
+        """
+        core, peeled = decomposition.peel_low_degree(self.graph, self.n_colors)
+        config = self.get_config()
+        config.update(decomposition=self.decomposition, max_workers=self.max_workers)
+        result = Solver(decomposition.get_subgraph(self.graph, core), should_stop=self.should_stop, **config).solve()
+        stats = dict(result.stats, core=len(core), peeled=len(peeled))
+        del stats['time']
+        if not result.solved and not self.anytime:
+            return result.status, stats
+        assignment = {variable: None for variable in self.graph}
+        assignment.update((variable, result.assignment[i]) for i, variable in enumerate(core))
+        decomposition.color_peeled(self.graph, assignment, peeled, self.n_colors)
+        self.colored_states.update(assignment)
+        self.colorize_map()
+        return result.status, stats
+
+    def solve(self):
+        """
+            returns a SolveResult with the final assignment and the search statistics, and never exits the process
+        """
+        domains = self.domains
+        if domains is None:
+            domains = [list(range(self.n_colors)) for _ in range(len(self.graph))]
+        start_time = time.perf_counter()
+        stats = {'filtering_mode': self.filtering_mode}
+        if self.use_peeling or self.decomposition is not None:
+            status, search_stats = self.peeled_solve() if self.use_peeling else self.decomposed_solve()
+            stats.update(search_stats)
+            if self.anytime and status != SOLVED:
+                stats['conflicts'] = utils.count_conflicts(self.graph, self.colored_states)
+            stats['time'] = time.perf_counter() - start_time
+            return SolveResult(status, dict(self.colored_states), stats)
+        if self.filtering_mode == '-ii':
+            solved, search_stats = self.iterative_improvement_solve(domains)
+            stats.update(search_stats)
+            status = SOLVED if solved else NOT_SOLVED
+        else:
+            solved = self.backtrack_solve(domains)
+            stats.update(self.search_stats)
+            stats['backtrack_count'] = self.backtrack_count
+            status = SOLVED if solved else NO_SOLUTION
+        if solved is None:
+            status = STOPPED
+        if self.anytime and not solved:
+            self.update_colored_states(self.best_assignment)
+            stats['conflicts'] = utils.count_conflicts(self.graph, self.colored_states)
+        stats['time'] = time.perf_counter() - start_time
+        return SolveResult(status, dict(self.colored_states), stats)
+
+
+def solve(graph, config=None):
     """
-        returns True when the CSP is solved, and False when backtracking is necessary
-        
-        you will need to use the global variables GRAPH and COLORED_STATES, refer to preprocess() and try to see what they represent
-        use FILTERING_MODE, USE_VARIABLE_ORDERING, and USE_VALUE_ORDERING for branching into each mode
-        FILTERING_MODE is either "-n", "-fc", or "-ac", and the other two are booleans
-        
-        HINT: you may want to import deepcopy to generate the input to the recursive calls
-        NOTE: remember to call colorize_map() after each value assignment for the graphical update
-              use colorize_map(True) if you want to manually progress by pressing any key
-        NOTE: don't forget to update BACKTRACK_COUNT on each backtrack
+        solves the coloring of graph with a Solver built from the config dict of Solver options
     """
-    global BACKTRACK_COUNT
-    if utils.is_solved(GRAPH, COLORED_STATES):
-        print("solved")
-        print(f"backtrack count: {BACKTRACK_COUNT}")
-        colorize_map(True)
-        exit(0)
-    if not utils.is_consistent(GRAPH, COLORED_STATES):
-        BACKTRACK_COUNT += 1
-        return
-    if FILTERING_MODE == '-ac':
-        if utils.ac3(GRAPH, COLORED_STATES, domains):
-            BACKTRACK_COUNT += 1
-            return
-    if USE_VARIABLE_ORDERING:
-        next_variable = utils.get_chosen_variable(GRAPH, COLORED_STATES, domains, FILTERING_MODE)
+    return Solver(graph, **(config or {})).solve()
+
+
+def get_coloring_colors(n_colors):
+    """
+        returns the BGR colors of n_colors colors, COLORING_COLORS first and then colors of evenly spaced hues
+    """
+    n_extra_colors = n_colors - len(COLORING_COLORS)
+    if n_extra_colors <= 0:
+        return COLORING_COLORS[:n_colors]
+    hsv = np.zeros((n_extra_colors, 1, 3), dtype=np.uint8)
+    hsv[:, 0] = [((2 * hue + 1) * 90 // n_extra_colors, EXTRA_COLOR_SATURATION, 255)
+                 for hue in range(n_extra_colors)]
+    extra_colors = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR).reshape(-1, 3)
+    return COLORING_COLORS + [tuple(color) for color in extra_colors.tolist()]
+
+
+def get_graph(image_map):
+    """
+        returns the graph of the preprocessed map as a dict mapping each region to the set of its neighbors
+    """
+    graph = {vertex: set() for vertex in range(len(image_map.nodes))}
+    for v in image_map.nodes:
+        for adj in v.adj:
+            graph[v.id].add(adj)
+            graph[adj].add(v.id)
+    return graph
+
+
+def load_map(image_path, use_cache=True):
+    """
+        reads the image and returns its preprocessed Map, or None if the image cannot be read
+        with use_cache, the graph is read from the graph cache when this image was already preprocessed,
+        and stored in it otherwise
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    is_large_image = image.shape[0] > MAXIMUM_IMAGE_HEIGHT or image.shape[1] > MAXIMUM_IMAGE_WIDTH
+    cache_key = cache.get_cache_key(image) if use_cache else None
+    cached_graph = cache.load_graph(cache_key) if use_cache else None
+    image_map = Map(image, vectorized=True, use_connected_components=True, use_spatial_index=True,
+                    tiled=is_large_image)
+    if cached_graph is not None:
+        image_map.load_graph(*cached_graph)
     else:
-        next_variable = utils.get_next_variable(COLORED_STATES, domains)
-    if USE_VALUE_ORDERING:
-        value_list = utils.get_ordered_domain(GRAPH, COLORED_STATES, domains, next_variable)
+        image_map.initial_preprocessing()
+        if use_cache:
+            cache.store_graph(cache_key, image_map)
+    return image_map
+
+
+def write_stats(path, image_path, image_map, preprocessing_time, result):
+    """
+        writes the preprocessing stage times and the search statistics of the result as JSON to path,
+        or to the standard output when path is -
+    """
+    report = {'map': image_path, 'regions': len(image_map.nodes),
+              'preprocessing': {'time': preprocessing_time, 'stages': image_map.stage_times},
+              'status': result.status, 'search': result.stats}
+    if path == '-':
+        print(json.dumps(report, indent=2))
     else:
-        value_list = domains[next_variable]
-    copy_domains = copy.deepcopy(domains)
-    for value in value_list:
-        if FILTERING_MODE == '-fc':
-            if utils.forward_check(GRAPH, COLORED_STATES, copy_domains, next_variable, value):
-                BACKTRACK_COUNT += 1
-                copy_domains = copy.deepcopy(domains)
-                continue
-        COLORED_STATES[next_variable] = value
-        colorize_map()
-        copy_domains[next_variable] = [value]
-        backtrack_solve(copy_domains)
-        copy_domains = copy.deepcopy(domains)
-        COLORED_STATES[next_variable] = None
-        colorize_map()
-    BACKTRACK_COUNT += 1
-    return
-
-
-'''ITERATIVE IMPROVEMENT SOLVER'''
-
-
-def iterative_improvement_solve(domains, max_steps=100):
+        with open(path, 'w') as stats_file:
+            json.dump(report, stats_file, indent=2)
+
+
+def parse_options(arguments):
     """
-        you will need to use the global variables GRAPH and COLORED_STATES, refer to preprocess() and try to see what they represent
-        don't forget to call colorize_map()
-        1. initialize all the variables randomly,
-        2. then change the conflicting values until solved, use max_steps to avoid infinite loops
+        splits the command line arguments into the positional ones and a dict of the --name[=value] options
     """
-    "*** YOUR CODE HERE ***"
-    for var in COLORED_STATES.keys():
-        COLORED_STATES[var] = random.choice(domains[var])
-    colorize_map()
-    steps = 0
-    while not utils.is_solved(GRAPH, COLORED_STATES) and steps < max_steps:
-        chosen_var = utils.random_choose_conflicted_var(GRAPH, COLORED_STATES)
-        chosen_color = utils.get_chosen_value(GRAPH, COLORED_STATES, domains, chosen_var)
-        COLORED_STATES[chosen_var] = chosen_color
-        colorize_map()
-        steps += 1
-    print('Steps: ', steps)
-    "*** YOUR CODE ENDS HERE ***"
-    print("solved")
-    colorize_map(True)
-
-
-def preprocess():
-    MAP.initial_preprocessing()
-    for vertex in range(len(MAP.nodes)):
-        GRAPH[vertex], COLORED_STATES[vertex] = set(), None
-    for v in MAP.nodes:
-        for adj in v.adj:
-            GRAPH[v.id].add(adj)
-            GRAPH[adj].add(v.id)
+    positional_arguments, options = [], {}
+    for argument in arguments:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            options[name] = value
+        else:
+            positional_arguments.append(argument)
+    return positional_arguments, options
 
 
 def assign_boolean_value(argument):
@@ -139,31 +428,131 @@ def assign_boolean_value(argument):
 
 
 if __name__ == "__main__":
+    arguments, options = parse_options(sys.argv[1:])
+    use_variable_ordering = use_value_ordering = None
     try:
-        MAP_IMAGE_PATH = sys.argv[1]
-        FILTERING_MODE = sys.argv[2]
-        is_ii_mode = FILTERING_MODE == "-ii"
-        if not is_ii_mode:
-            USE_VARIABLE_ORDERING = assign_boolean_value(sys.argv[3])
-            USE_VALUE_ORDERING = assign_boolean_value(sys.argv[4])
-            if USE_VARIABLE_ORDERING is None or USE_VALUE_ORDERING is None:
+        map_image_path = arguments[0]
+        filtering_mode = arguments[1]
+        is_ii_mode = filtering_mode == "-ii"
+        is_portfolio_mode = filtering_mode == "-p"
+        if not is_ii_mode and not is_portfolio_mode:
+            use_variable_ordering = assign_boolean_value(arguments[2])
+            use_value_ordering = assign_boolean_value(arguments[3])
+            if use_variable_ordering is None or use_value_ordering is None:
                 print("invalid ordering flags")
                 exit(1)
-    except IndexError:
+        headless = 'headless' in options
+        output_path = options.get('output') or os.path.splitext(map_image_path)[0] + '_colored.png'
+        ac_algorithm = options.get('ac-algorithm') or csp.AC3
+        if ac_algorithm not in (csp.AC3, csp.AC2001):
+            print(f"invalid ac algorithm, expected {csp.AC3} or {csp.AC2001}")
+            exit(1)
+        max_steps = int(options.get('max-steps') or MAX_STEPS)
+        time_limit = float(options['time-limit']) if options.get('time-limit') else None
+        node_limit = int(options['node-limit']) if options.get('node-limit') else None
+        anytime = 'anytime' in options
+        stats_path = options.get('stats')
+        decompose = options.get('decompose') or None
+        if decompose not in (None, decomposition.COMPONENTS, decomposition.BLOCKS):
+            print(f"invalid decomposition, expected {decomposition.COMPONENTS} or {decomposition.BLOCKS}")
+            exit(1)
+        max_workers = int(options.get('workers') or 1)
+        use_peeling = 'peel' in options
+        variable_heuristic = csp.DSATUR if 'dsatur' in options else csp.MRV
+        profile_path = options.get('profile')
+        frame_recorder = None
+        if options.get('frames'):
+            frame_recorder = FrameRecorder(options['frames'], int(options.get('frame-every') or 1))
+        unknown_options = [name for name in options if name not in OPTIONS]
+        if unknown_options:
+            print(f"Error: unknown options: {', '.join(unknown_options)}")
+            exit(1)
+    except (IndexError, ValueError):
         print("Error: invalid arguments.")
         exit(1)
 
-    try:
-        MAP = Map(cv2.imread(MAP_IMAGE_PATH, cv2.IMREAD_COLOR))
-    except Exception as e:
+    preprocessing_start_time = time.perf_counter()
+    image_map = load_map(map_image_path, use_cache='no-cache' not in options)
+    preprocessing_time = time.perf_counter() - preprocessing_start_time
+    if image_map is None:
         print("Could not read the specified image")
         exit(1)
 
-    preprocess()
-    domains = [list(range(N_COLORS)) for _ in range(len(GRAPH.keys()))]
+    solver = Solver(get_graph(image_map), filtering_mode, use_variable_ordering, use_value_ordering,
+                    image_map=image_map, headless=headless, frame_recorder=frame_recorder,
+                    ac_algorithm=ac_algorithm, max_steps=max_steps, time_limit=time_limit,
+                    time_helpers=stats_path is not None, decomposition=decompose, max_workers=max_workers,
+                    use_peeling=use_peeling, variable_heuristic=variable_heuristic, node_limit=node_limit,
+                    anytime=anytime)
+    if 'minimize' in options:
+        from minimize import minimize_colors
+        config = solver.get_config()
+        del config['n_colors'], config['time_limit'], config['node_limit']
+        config.update(decomposition=decompose, max_workers=max_workers, use_peeling=use_peeling)
+        result = minimize_colors(solver.graph, None if is_portfolio_mode else config, time_limit, node_limit)
+        print(f"colors: {result.stats['n_colors']} (upper bound {result.stats['upper_bound']}, lower bound "
+              f"{result.stats['lower_bound']}, {'optimal' if result.stats['optimal'] else 'not proven optimal'}), "
+              f"searches: {result.stats['searches']}, time: {result.stats['time']:.3f}s")
+        solver.n_colors = max(result.stats['n_colors'], N_COLORS)
+        solver.colored_states.update(result.assignment)
+        solver.show_solution(output_path if headless else None)
+        if headless:
+            print(f"colored map saved to {output_path}")
+        exit(0)
+    if is_portfolio_mode:
+        from portfolio import solve_portfolio
+        result, reports = solve_portfolio(solver.graph)
+        for report in reports:
+            print(f"{report['config']:<20}{report['status']:<12}{report['time']:.3f}s"
+                  + (f"  {report['message']}" if 'message' in report else ""))
+        if result is None:
+            print(NOT_SOLVED)
+            exit(1)
+        print(f"solved by {result.stats['config']}")
+        solver.colored_states.update(result.assignment)
+        solver.show_solution(output_path if headless else None)
+        if headless:
+            print(f"colored map saved to {output_path}")
+        exit(0)
+    if decompose is not None:
+        print(f"decomposition: {decompose}, workers: {max_workers}")
     if not is_ii_mode:
         print(
-            f"filtering mode: {FILTERING_MODE}, use variable ordering: {USE_VARIABLE_ORDERING}, use value ordering: {USE_VALUE_ORDERING}")
-        backtrack_solve(domains)
-    else:
-        iterative_improvement_solve(domains)
+            f"filtering mode: {filtering_mode}, use variable ordering: {use_variable_ordering}, use value ordering: {use_value_ordering}")
+        if use_variable_ordering:
+            print(f"variable heuristic: {variable_heuristic}")
+    profiler = cProfile.Profile() if profile_path else None
+    if profiler is not None:
+        profiler.enable()
+    result = solver.solve()
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        print(f"profile saved to {profile_path}")
+    if stats_path:
+        write_stats(stats_path, map_image_path, image_map, preprocessing_time, result)
+    if is_ii_mode:
+        print('Steps: ', result.stats['steps'])
+        print(f"restarts: {result.stats['restarts']}, steps per second: {result.stats['steps_per_second']:.0f}")
+        if result.solved:
+            print(f"time to solution: {result.stats['solution_time']:.3f}s")
+    print(result.status)
+    if anytime and not result.solved:
+        print(f"best coloring found: {result.stats['conflicts']} conflicting borders")
+    if not is_ii_mode and result.solved:
+        print(f"backtrack count: {result.stats['backtrack_count']}")
+        print(f"expanded nodes: {result.stats['expanded_nodes']}, assignments: {result.stats['assignments']}, "
+              f"max depth: {result.stats['max_depth']}")
+        if filtering_mode == '-ac':
+            print(f"{ac_algorithm} revisions: {result.stats['revisions']}, support checks: "
+                  f"{result.stats['support_checks']}, pruned values: {result.stats['pruned_values']}")
+    if result.solved or is_ii_mode or anytime:
+        solver.show_solution(output_path if headless else None)
+        if headless:
+            print(f"colored map saved to {output_path}")
+    if use_peeling:
+        print(f"peeled: {result.stats['peeled']}, core: {result.stats['core']}")
+    if decompose is not None:
+        print(f"parts: {result.stats['parts']}, largest part: {result.stats['largest_part']}")
+    if not result.solved:
+        exit(1)
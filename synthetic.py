@@ -0,0 +1,85 @@
+import sys
+import itertools
+import cv2
+import numpy as np
+from scipy.spatial import Delaunay, cKDTree
+
+PIXELS_PER_REGION = 40 * 40
+MINIMUM_IMAGE_SIZE = 400
+BORDER_WIDTH = 3
+BORDER_COLOR = (0, 0, 0)
+REGION_COLOR_LOW = 60
+REGION_COLOR_HIGH = 200
+
+
+def get_seed_points(n_regions, seed=0):
+    """
+        returns n_regions random points of the unit square, the seeds of the regions of a synthetic map
+    """
+    return np.random.default_rng(seed).random((n_regions, 2))
+
+
+def get_delaunay_graph(n_regions, seed=0):
+    """
+        returns the adjacency graph of a random planar triangulation, the densest graph a map of n_regions can have
+        it is the graph of the regions of render_voronoi_map() with the same seed
+        with fewer than 4 regions, which cannot be triangulated, every region is adjacent to every other one
+    """
+    graph = {vertex: set() for vertex in range(n_regions)}
+    if n_regions < 4:
+        for u, v in itertools.combinations(range(n_regions), 2):
+            graph[u].add(v)
+            graph[v].add(u)
+        return graph
+    triangulation = Delaunay(get_seed_points(n_regions, seed))
+    for simplex in triangulation.simplices.tolist():
+        for u, v in itertools.combinations(simplex, 2):
+            graph[u].add(v)
+            graph[v].add(u)
+    return graph
+
+
+def get_sparse_planar_graph(n_regions, kept_edge_ratio, seed=0):
+    """
+        returns get_delaunay_graph() with only about kept_edge_ratio of its edges, chosen at random,
+        closer to the graphs of real maps, where many regions have three neighbors or less
+    """
+    graph = get_delaunay_graph(n_regions, seed)
+    rng = np.random.default_rng(seed)
+    for u in graph:
+        for v in sorted(graph[u]):
+            if u < v and rng.random() >= kept_edge_ratio:
+                graph[u].discard(v)
+                graph[v].discard(u)
+    return graph
+
+
+def render_voronoi_map(n_regions, seed=0, size=None):
+    """
+        draws the Voronoi partition of the seed points as a square map image, each region filled with a random color
+        that the preprocessing does not take for background and separated from the others by BORDER_WIDTH wide borders,
+        so that synthetic maps can go through the Map preprocessing too
+        by default, the image gets about PIXELS_PER_REGION pixels for each region
+    """
+    if size is None:
+        size = max(MINIMUM_IMAGE_SIZE, int(np.sqrt(n_regions * PIXELS_PER_REGION)))
+    points = get_seed_points(n_regions, seed) * size
+    ys, xs = np.mgrid[0:size, 0:size]
+    _, labels = cKDTree(points).query(np.column_stack([xs.ravel(), ys.ravel()]))
+    labels = labels.reshape(size, size)
+    colors = np.random.default_rng(seed).integers(REGION_COLOR_LOW, REGION_COLOR_HIGH, (n_regions, 3), dtype=np.uint8)
+    image = colors[labels]
+    border = np.zeros((size, size), dtype=np.uint8)
+    border[:, 1:] |= labels[:, 1:] != labels[:, :-1]
+    border[1:, :] |= labels[1:, :] != labels[:-1, :]
+    border = cv2.dilate(border, np.ones((BORDER_WIDTH - 1, BORDER_WIDTH - 1), dtype=np.uint8)) if BORDER_WIDTH > 2 \
+        else border
+    image[border > 0] = BORDER_COLOR
+    return image
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("usage: python synthetic.py <n_regions> <output_path> [seed]")
+        exit(1)
+    cv2.imwrite(sys.argv[2], render_voronoi_map(int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) == 4 else 0))
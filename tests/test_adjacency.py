@@ -0,0 +1,27 @@
+import os
+import cv2
+import pytest
+from map import Map
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAP_NAMES = ['iran.jpg', 'usa.png', 'tehran_province.jpg']
+
+
+def get_edges(image, use_spatial_index):
+    """
+        returns the (i, j) edges, with i < j, that the adjacency builder finds on the labelled image
+    """
+    image_map = Map(image, vectorized=True, use_connected_components=True, use_spatial_index=use_spatial_index)
+    image_map.filter_image()
+    image_map.find_graph_nodes()
+    if use_spatial_index:
+        image_map.add_graph_edges_spatial()
+    else:
+        image_map.add_graph_edges()
+    return {(node.id, neighbor) for node in image_map.nodes for neighbor in node.adj if node.id < neighbor}
+
+
+@pytest.mark.parametrize('map_name', MAP_NAMES)
+def test_spatial_adjacency_finds_the_same_edges(map_name):
+    image = cv2.imread(os.path.join(REPOSITORY_PATH, map_name), cv2.IMREAD_COLOR)
+    assert get_edges(image.copy(), True) == get_edges(image.copy(), False)
@@ -1,4 +1,9 @@
+import heapq
 import random
+import numpy as np
+from collections import deque
+
+NO_VALUE = -1
 
 
 def is_consistent(graph, variable_value_pairs):
@@ -123,24 +128,28 @@ def ac3(graph, variable_value_pairs, domains):
         maintains arc-consistency
         returns True if backtracking is necessary, and False otherwise
     """
-    queue = []
+    queue = deque()
     for variable, color in variable_value_pairs.items():
         if color is None:
             for neighbor in graph[variable]:
                 queue.append((variable, neighbor))
+    queued = set(queue)
     while queue:
-        x1, x2 = queue.pop(0)
+        x1, x2 = queue.popleft()
+        queued.discard((x1, x2))
         if remove_inconsistent_values(domains, x1, x2):
             if not domains[x1]:
                 return True
             for neighbor in graph[x1]:
-                queue.append([neighbor, x1])
+                if neighbor != x2 and (neighbor, x1) not in queued:
+                    queue.append((neighbor, x1))
+                    queued.add((neighbor, x1))
     return False
 
 
 def remove_inconsistent_values(domains, x1, x2):
     removed = False
-    for color in domains[x1]:
+    for color in list(domains[x1]):
         flag = True
         for value in domains[x2]:
             if color != value:
@@ -152,19 +161,20 @@ def remove_inconsistent_values(domains, x1, x2):
     return removed
 
 
-def random_choose_conflicted_var(graph, variable_value_pairs):
+def random_choose_conflicted_var(graph, variable_value_pairs, rng=random):
     """
         returns a random variable that is conflicting with a constraint
+        rng can be a random.Random instance to draw from instead of the shared module state
     """
     conflicted_vars = []
     for var, neighbors in graph.items():
         for neighbor in neighbors:
             if variable_value_pairs[var] == variable_value_pairs[neighbor]:
                 conflicted_vars.append(var)
-    return random.choice(conflicted_vars)
+    return rng.choice(conflicted_vars)
 
 
-def get_chosen_value(graph, variable_value_pairs, domains, variable):
+def get_chosen_value(graph, variable_value_pairs, domains, variable, rng=random):
     """
         returns the value by using the proper heuristic
         NOTE: handle tie-breaking by random
@@ -180,5 +190,166 @@ def get_chosen_value(graph, variable_value_pairs, domains, variable):
             min_conflicts = conflicts
             chosen_value = color
         elif conflicts == min_conflicts:
-            chosen_value = random.choice([chosen_value, color])
+            chosen_value = rng.choice([chosen_value, color])
     return chosen_value
+
+
+def get_renumbering(n_variables, removed):
+    """
+        returns the new number of each variable that has to move once the removed variables are dropped, so that the
+        variables are numbered from 0 again: the last variables that are kept take the numbers of the removed ones,
+        and only as many variables as were removed move
+    """
+    removed = set(removed)
+    n_kept = n_variables - len(removed)
+    holes = sorted(variable for variable in removed if variable < n_kept)
+    moved = [variable for variable in range(n_kept, n_variables) if variable not in removed]
+    return dict(zip(moved, holes))
+
+
+def count_conflicts(graph, variable_value_pairs):
+    """
+        returns the number of edges whose two variables have the same value
+    """
+    return sum(variable_value_pairs[variable] is not None and
+               variable_value_pairs[variable] == variable_value_pairs[neighbor]
+               for variable in graph for neighbor in graph[variable] if variable < neighbor)
+
+
+def complete_assignment(graph, variable_value_pairs, domains):
+    """
+        gives each unassigned variable the value of its domain that conflicts with the fewest of its assigned
+        neighbors, the lowest such value on ties, so that a partial assignment becomes a complete one
+        the variables are taken in DSATUR order, the one with the most distinct values among its assigned neighbors
+        first, then the one with the most neighbors, from a heap where a variable is pushed again whenever its
+        saturation grows and outdated entries are skipped
+        variable_value_pairs is updated in place
+    """
+    neighbor_values = {variable: set() for variable in graph}
+    for variable in graph:
+        if variable_value_pairs[variable] is not None:
+            for neighbor in graph[variable]:
+                neighbor_values[neighbor].add(variable_value_pairs[variable])
+    heap = [(-len(neighbor_values[variable]), -len(graph[variable]), variable)
+            for variable in graph if variable_value_pairs[variable] is None]
+    heapq.heapify(heap)
+    while heap:
+        saturation, _, variable = heapq.heappop(heap)
+        if variable_value_pairs[variable] is not None or -saturation != len(neighbor_values[variable]):
+            continue
+        values = [variable_value_pairs[neighbor] for neighbor in graph[variable]]
+        value = variable_value_pairs[variable] = min(domains[variable], key=values.count)
+        for neighbor in graph[variable]:
+            if variable_value_pairs[neighbor] is None and value not in neighbor_values[neighbor]:
+                neighbor_values[neighbor].add(value)
+                heapq.heappush(heap, (-len(neighbor_values[neighbor]), -len(graph[neighbor]), neighbor))
+
+
+'''ARRAY VERSIONS'''
+
+
+def to_csr(graph):
+    """
+        returns the graph as the CSR arrays indptr and indices: the neighbors of variable v are
+        indices[indptr[v]:indptr[v + 1]], in increasing order
+    """
+    n_variables = len(graph)
+    degrees = np.fromiter((len(graph[variable]) for variable in range(n_variables)), dtype=np.int64,
+                          count=n_variables)
+    indptr = np.zeros(n_variables + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.fromiter((neighbor for variable in range(n_variables) for neighbor in sorted(graph[variable])),
+                          dtype=np.int32, count=int(indptr[-1]))
+    return indptr, indices
+
+
+def get_edge_sources(indptr):
+    """
+        returns the variable each entry of indices belongs to, which the whole-graph checks below compare
+        with indices, it can be computed once and passed to them as sources
+    """
+    return np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+
+
+def get_assignment_dtype(n_colors):
+    """
+        returns the smallest signed integer type that holds the colors 0 to n_colors - 1 and NO_VALUE
+    """
+    return np.min_scalar_type(-n_colors)
+
+
+def get_domain_dtype(n_colors):
+    """
+        returns the smallest unsigned integer type with a bit for each of the n_colors colors
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if n_colors <= np.iinfo(dtype).bits:
+            return np.dtype(dtype)
+    raise ValueError(f"the domain bitmasks hold at most 64 colors, not {n_colors}")
+
+
+def to_assignment_array(variable_value_pairs, n_colors):
+    """
+        returns the assignment as an array of get_assignment_dtype(n_colors), with NO_VALUE for the unassigned
+        variables
+    """
+    return np.array([NO_VALUE if variable_value_pairs[variable] is None else variable_value_pairs[variable]
+                     for variable in range(len(variable_value_pairs))], dtype=get_assignment_dtype(n_colors))
+
+
+def to_domain_array(domains, n_colors):
+    """
+        returns the domains as an array of bitmasks of get_domain_dtype(n_colors), bit c of a domain is set when
+        it holds the color c
+    """
+    return np.array([sum(1 << color for color in domain) for domain in domains], dtype=get_domain_dtype(n_colors))
+
+
+def is_consistent_array(indptr, indices, assignment, sources=None):
+    """
+        is_consistent() over the CSR graph and the assignment array
+    """
+    if sources is None:
+        sources = get_edge_sources(indptr)
+    values = assignment[sources]
+    return not np.any((values == assignment[indices]) & (values != NO_VALUE))
+
+
+def is_solved_array(indptr, indices, assignment, sources=None):
+    """
+        is_solved() over the CSR graph and the assignment array
+    """
+    return bool(np.all(assignment != NO_VALUE)) and is_consistent_array(indptr, indices, assignment, sources)
+
+
+def forward_check_array(indptr, indices, assignment, domains, variable, value):
+    """
+        forward_check() over the CSR graph, the assignment array and the bitmask domain array,
+        the value is removed from the domains of the unassigned neighbors in place, in the order of indices,
+        up to the first neighbor whose domain is wiped out
+        returns True if backtracking is necessary, and False otherwise
+    """
+    neighbors = indices[indptr[variable]:indptr[variable + 1]]
+    neighbors = neighbors[assignment[neighbors] == NO_VALUE]
+    pruned = domains[neighbors] & ~domains.dtype.type(1 << value)
+    wiped_out = pruned == 0
+    if wiped_out.any():
+        last = np.argmax(wiped_out) + 1
+        domains[neighbors[:last]] = pruned[:last]
+        return True
+    domains[neighbors] = pruned
+    return False
+
+
+def get_chosen_value_array(indptr, indices, assignment, domains, variable, rng=random):
+    """
+        get_chosen_value() over the CSR graph, the assignment array and the bitmask domain array
+        returns the value of the domain of the variable that the fewest neighbors have, ties broken by random
+    """
+    n_bits = domains.dtype.itemsize * 8
+    colors = np.flatnonzero((domains[variable] >> np.arange(n_bits, dtype=domains.dtype)) & 1)
+    if not len(colors):
+        return None
+    neighbor_values = assignment[indices[indptr[variable]:indptr[variable + 1]]]
+    conflicts = np.bincount(neighbor_values[neighbor_values != NO_VALUE], minlength=n_bits)[colors]
+    return int(rng.choice(colors[conflicts == conflicts.min()].tolist()))